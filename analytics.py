@@ -0,0 +1,177 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+# Circulation reports over the loan ledger. The ledger is read incrementally:
+# each refresh() only ingests the loans opened and the loans returned since the
+# last one, and folds them into running totals kept as
+# dense NumPy arrays indexed by book code, member code, author code and day.
+# A code is the order in which an ID was first seen, so the arrays grow with
+# the books and members that circulate, not with the largest ID. A dashboard
+# query is then a top-k or a slice over those arrays, never a rescan of the
+# history.
+
+DAY = 86400                           # Loans are bucketed by UTC day (epoch seconds // DAY)
+
+
+def _grow(array, size, fill=0):       # array padded with fill to at least size entries (doubling, so growth is amortised).
+    if size <= len(array):
+        return array
+    grown = np.full(max(size, 2 * len(array)), fill, dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+
+def _encode(ids, codes, decoded):    # Dense codes for an array of IDs; IDs seen for the first time get the next codes.
+    unique, inverse = np.unique(ids, return_inverse=True)
+    values = unique.tolist()
+    new = [value for value in values if value not in codes]
+    codes.update(zip(new, range(len(decoded), len(decoded) + len(new))))
+    decoded.extend(new)
+    return np.fromiter(map(codes.__getitem__, values), np.int64, len(values))[inverse]
+
+
+def _top(counts, limit):              # Indices of the `limit` largest non-zero counts, largest first.
+    nonzero = np.flatnonzero(counts)
+    if len(nonzero) > limit:
+        nonzero = nonzero[np.argpartition(counts[nonzero], -limit)[-limit:]]
+    return nonzero[np.argsort(-counts[nonzero], kind="stable")]
+
+
+class CirculationStats:
+    def __init__(self, library):
+        self.__library = library
+        self.__lock = threading.Lock()
+        self.__last_loan_id = 0       # Highest loan ID ingested so far
+        self.__returns_seen = 0       # Position reached in the library's return log
+        self.__by_book = np.zeros(1024, dtype=np.int64)      # Loans per book code
+        self.__by_member = np.zeros(1024, dtype=np.int64)    # Loans per member code
+        self.__by_author = np.zeros(64, dtype=np.int64)      # Loans per author code
+        self.__book_codes = {}        # {book_id: code}
+        self.__book_ids = []          # Book ID of each code
+        self.__member_codes = {}      # {member_id: code}
+        self.__member_ids = []        # Member ID of each code
+        self.__author_codes = {}      # {author: code}
+        self.__authors = []           # Author of each code
+        self.__book_author = np.full(1024, -1, dtype=np.int64)   # Author code of each book code, -1 if unseen
+        self.__first_day = None       # Day index 0 of the per-day arrays
+        self.__loans_by_day = np.zeros(64, dtype=np.int64)   # Loans opened per day
+        self.__active_delta = np.zeros(64, dtype=np.int64)   # +1 on each loan's first day, -1 on its return day
+        self.__loans = []             # Columnar loan records, one dict of arrays per ingested chunk
+        self.__frame = None           # Cached concatenation of __loans for loan_frame()
+
+    def refresh(self):                # Ingests new loans and returns since the last call; returns the number of new loans.
+        with self.__lock:
+            # Returns are read first, so every loan they close is among the loans read next.
+            returned, self.__returns_seen = self.__library.returns_after(self.__returns_seen)
+            loans = self.__library.loans_after(self.__last_loan_id)
+            if loans:
+                self.__ingest(loans)
+            self.__add_returns(np.fromiter((loan.returned_at for loan in returned), np.float64, len(returned)))
+            return len(loans)
+
+    def __ingest(self, loans):
+        loan_ids = np.fromiter((loan.loan_id for loan in loans), np.int64, len(loans))
+        book_ids = np.fromiter((loan.book_id for loan in loans), np.int64, len(loans))
+        member_ids = np.fromiter((loan.member_id for loan in loans), np.int64, len(loans))
+        borrowed_at = np.fromiter((loan.borrowed_at for loan in loans), np.float64, len(loans))
+        self.__last_loan_id = int(loan_ids[-1])
+        self.__loans.append({"loan_id": loan_ids, "book_id": book_ids, "member_id": member_ids,
+                             "borrowed_at": borrowed_at})
+        self.__frame = None
+
+        book_codes = _encode(book_ids, self.__book_codes, self.__book_ids)
+        member_codes = _encode(member_ids, self.__member_codes, self.__member_ids)
+        self.__by_book = _grow(self.__by_book, len(self.__book_ids))
+        self.__by_book += np.bincount(book_codes, minlength=len(self.__by_book))
+        self.__by_member = _grow(self.__by_member, len(self.__member_ids))
+        self.__by_member += np.bincount(member_codes, minlength=len(self.__by_member))
+
+        self.__book_author = _grow(self.__book_author, len(self.__book_ids), fill=-1)
+        for code in np.unique(book_codes[self.__book_author[book_codes] < 0]).tolist():   # Authors of books seen for the first time
+            book = self.__library.get_book(self.__book_ids[code])
+            author = book.author if book is not None else "(removed)"
+            if author not in self.__author_codes:
+                self.__author_codes[author] = len(self.__authors)
+                self.__authors.append(author)
+            self.__book_author[code] = self.__author_codes[author]
+        self.__by_author = _grow(self.__by_author, len(self.__authors))
+        self.__by_author += np.bincount(self.__book_author[book_codes], minlength=len(self.__by_author))
+
+        days = self.__days(borrowed_at)
+        self.__loans_by_day += np.bincount(days, minlength=len(self.__loans_by_day))
+        self.__active_delta += np.bincount(days, minlength=len(self.__active_delta))
+
+    def __add_returns(self, returned_at):
+        if len(returned_at):
+            days = self.__days(returned_at)   # May grow __active_delta, so before it is read below
+            self.__active_delta -= np.bincount(days, minlength=len(self.__active_delta))
+
+    def __days(self, timestamps):     # Day indices for timestamps, growing the per-day arrays to hold them.
+        days = (timestamps // DAY).astype(np.int64)
+        if self.__first_day is None:
+            self.__first_day = int(days.min())
+        if days.min() < self.__first_day:   # Older than anything seen: shift the arrays right
+            shift = self.__first_day - int(days.min())
+            self.__loans_by_day = np.concatenate([np.zeros(shift, np.int64), self.__loans_by_day])
+            self.__active_delta = np.concatenate([np.zeros(shift, np.int64), self.__active_delta])
+            self.__first_day -= shift
+        days -= self.__first_day
+        self.__loans_by_day = _grow(self.__loans_by_day, int(days.max()) + 1)
+        self.__active_delta = _grow(self.__active_delta, int(days.max()) + 1)
+        return days
+
+    def top_titles(self, limit=10):   # Most borrowed titles as table rows.
+        with self.__lock:
+            counts, book_ids = self.__by_book.copy(), self.__book_ids   # Append-only: no copy needed
+        rows = []
+        for code in _top(counts, limit).tolist():
+            book_id = book_ids[code]
+            book = self.__library.get_book(book_id)
+            rows.append({"ID": book_id, "Title": book.title if book else "(removed)",
+                         "Author": book.author if book else "", "Loans": int(counts[code])})
+        return rows
+
+    def author_demand(self, limit=10):   # Loans per author, most demanded first.
+        with self.__lock:
+            counts, authors = self.__by_author.copy(), list(self.__authors)
+        return [{"Author": authors[code], "Loans": int(counts[code])} for code in _top(counts, limit).tolist()]
+
+    def member_activity(self, limit=10):   # Members with the most loans.
+        with self.__lock:
+            counts, member_ids = self.__by_member.copy(), self.__member_ids
+        rows = []
+        for code in _top(counts, limit).tolist():
+            member_id = member_ids[code]
+            member = self.__library.get_member(member_id)
+            rows.append({"ID": member_id, "Name": member.name if member else "(removed)",
+                         "Loans": int(counts[code]), "On loan": len(member.borrowed_books) if member else 0})
+        return rows
+
+    def daily(self, days=30, now=None):   # Per-day loans, active loans and utilisation over the last `days` days.
+        now = time.time() if now is None else now
+        with self.__lock:
+            if self.__first_day is None:
+                return pd.DataFrame(columns=["Loans", "Active loans", "Utilisation"])
+            today = int(now // DAY) - self.__first_day
+            size = max(today + 1, 1)
+            loans = _grow(self.__loans_by_day, size)[:size]
+            active = np.cumsum(_grow(self.__active_delta, size)[:size])
+            first_day = self.__first_day
+        start = max(size - days, 0)
+        index = pd.to_datetime(np.arange(first_day + start, first_day + size) * DAY, unit="s").date
+        frame = pd.DataFrame({"Loans": loans[start:], "Active loans": active[start:]}, index=index)
+        frame["Utilisation"] = frame["Active loans"] / max(self.__library.count_copies(), 1)
+        return frame
+
+    def loan_frame(self):             # Every ingested loan as a DataFrame (loan_id, book_id, member_id, borrowed_at).
+        with self.__lock:
+            if self.__frame is None:
+                if not self.__loans:
+                    return pd.DataFrame(columns=["loan_id", "book_id", "member_id", "borrowed_at"])
+                columns = {name: np.concatenate([chunk[name] for chunk in self.__loans]) for name in self.__loans[0]}
+                self.__loans = [columns]
+                self.__frame = pd.DataFrame(columns)
+            return self.__frame
@@ -1,28 +1,36 @@
+import io
+import logging
+import os
+import secrets
+import threading
+
 import streamlit as st
-from entendimiento2 import Book, Library, Member, Librarian
+from analytics import CirculationStats
+from catalog_io import FORMATS, detect_format, export_books, import_books
+from entendimiento2 import EVENTS, Book, Library, Member, Librarian
+from jobs import CANCELLED, DONE, JobRunner
+from metrics import EventFormatter
+from storage import open_storage
+
+PAGE_SIZE = 20    # Books rendered per page of the catalog table
+DB_PATH = os.environ.get("LIBRARY_DB", "library.db")    # SQLite file, or journal directory (see open_storage), shared by every session
+METRICS_PORT = os.environ.get("LIBRARY_METRICS_PORT")    # Serve Prometheus metrics on this local port if set
+EVENT_LOG = os.environ.get("LIBRARY_EVENT_LOG")          # Append JSON-lines events to this file if set
 
 # Function to initialize session state
 def reset_session():
     st.session_state.logged_in = False
     st.session_state.user_type = None
-    st.session_state.current_user = None
+    st.session_state.session_token = None
     st.session_state.registering = False
     st.session_state.show_books = False
     st.session_state.show_members = False
-    st.session_state.borrow_book_id = ""
-    st.session_state.return_book_id = ""
-    st.session_state.new_password = ""
-    st.session_state.new_book_title = ""
-    st.session_state.new_book_author = ""
-    st.session_state.new_book_id = ""
-    st.session_state.remove_book_id = ""
+    st.session_state.show_overdue = False
+    st.session_state.show_reports = False
     st.session_state.change_password = False
 
-# Initialize library and sample data
-if 'library' not in st.session_state:
-    st.session_state.library = Library()
-    
-    # Sample data
+# Sample data, only the first time the database is created
+def seed_sample_data(library):
     books = [
         # Clasics
         Book("The Great Gatsby", "F. Scott Fitzgerald", 1),
@@ -48,22 +56,58 @@ if 'library' not in st.session_state:
     
     
     for book in books:
-        st.session_state.library.add_book(book)
+        library.add_book(book)
     
     member1 = Member("Alice", "secure123", 1001)
     member2 = Member("Bob", "password456", 1002)
     
-    librarian1 = Librarian("Charlie", "admin123", 2001, st.session_state.library)
+    librarian1 = Librarian("Charlie", "admin123", 2001, library)
     
-    st.session_state.library.add_member(member1)
-    st.session_state.library.add_member(member2)
+    library.add_member(member1)
+    library.add_member(member2)
     
-    st.session_state.library.add_librarian(librarian1)
+    library.add_librarian(librarian1)
+
+# One Library per server process, shared by every session
+@st.cache_resource
+def get_library():
+    library = Library(open_storage(DB_PATH))
+    if EVENT_LOG:
+        handler = logging.FileHandler(EVENT_LOG, encoding="utf-8")
+        handler.setFormatter(EventFormatter())
+        EVENTS.addHandler(handler)
+        EVENTS.setLevel(logging.INFO)
+    if METRICS_PORT:
+        library.metrics.serve(int(METRICS_PORT))
+    if library.storage.load_setting("seeded") is None:   # Seeded once per database: an emptied catalog stays empty
+        if library.count_books() == 0 and not library.show_members():
+            seed_sample_data(library)
+        library.storage.save_setting("seeded", "1")
+    threading.Thread(target=library.build_search_index, name="search-index", daemon=True).start()
+    return library
+
+library = get_library()
+
+# One job runner per server process: a job outlives the rerun (and the session) that submitted it
+@st.cache_resource
+def get_jobs():
+    return JobRunner()
+
+jobs = get_jobs()
+
+# Circulation rollups shared by every librarian; each view only folds in the loans since the last one
+@st.cache_resource
+def get_stats():
+    return CirculationStats(get_library())
 
 # Initialize session state
 if 'logged_in' not in st.session_state:
     reset_session()
 
+# The logged-in user, looked up in the shared library from the session's login token
+def current_user():
+    return library.session_user(st.session_state.session_token)
+
 # Main function
 def main():
     st.title("📚 Library Management System")
@@ -76,10 +120,14 @@ def main():
             show_registration_page()
     else:
         # Page for authenticated users
-        if isinstance(st.session_state.current_user, Member):
+        user = current_user()
+        if isinstance(user, Member):
             show_member_interface()
-        elif isinstance(st.session_state.current_user, Librarian):
+        elif isinstance(user, Librarian):
             show_librarian_interface()
+        else:    # The account was removed since this session logged in
+            reset_session()
+            st.rerun()
 
 # Show login page
 def show_login_page():
@@ -99,22 +147,19 @@ def show_login_page():
 
 # Authenticate user
 def authenticate_user(user_id, password):
-    if st.session_state.user_type == "Member":
-        members = st.session_state.library._Library__members
-        if user_id in members and members[user_id].password == password:
-            st.session_state.current_user = members[user_id]
-            st.session_state.logged_in = True
-            st.success("Logged in as member!")
-        else:
-            st.error("Invalid member ID or password")
-    else:  # Librarian
-        librarians = st.session_state.library._Library__librarians
-        if user_id in librarians and librarians[user_id].password == password:
-            st.session_state.current_user = librarians[user_id]
-            st.session_state.logged_in = True
-            st.success("Logged in as librarian!")
-        else:
-            st.error("Invalid librarian ID or password")
+    role = st.session_state.user_type
+    client = st.session_state.setdefault("client_id", secrets.token_hex(8))    # Rate-limit key of this browser session
+    try:
+        token = library.authenticate(role, user_id, password, client=client)
+    except ValueError as e:    # Too many attempts: shown without a rerun so the wait stays on screen
+        st.error(str(e))
+        return
+    if token is not None:
+        st.session_state.session_token = token
+        st.session_state.logged_in = True
+        st.success(f"Logged in as {role.lower()}!")
+    else:
+        st.error(f"Invalid {role.lower()} ID or password")
     st.rerun()
 
 # Show registration page
@@ -139,24 +184,21 @@ def register_user(user_type, name, user_id, password):
         return
     
     # Verificar si el ID ya existe (tanto para miembros como bibliotecarios)
-    all_members = st.session_state.library._Library__members
-    all_librarians = st.session_state.library._Library__librarians
-    
     if user_type == "Member":
-        if user_id in all_members:
+        if library.get_member(user_id) is not None:
             st.error(f"Registration failed: The ID {user_id} is already in use by another member.")
             return  # Detener el registro aquí
         else:
             new_member = Member(name, password, user_id)
-            st.session_state.library.add_member(new_member)
+            library.add_member(new_member)
             st.success("Member registered successfully! Please login.")
     else:  # Librarian
-        if user_id in all_librarians:
+        if library.get_librarian(user_id) is not None:
             st.error(f"Registration failed: The ID {user_id} is already in use by another librarian.")
             return
         else:
-            new_librarian = Librarian(name, password, user_id, st.session_state.library)
-            st.session_state.library.add_librarian(new_librarian)
+            new_librarian = Librarian(name, password, user_id, library)
+            library.add_librarian(new_librarian)
             st.success("Librarian registered successfully! Please login.")
     
     st.session_state.registering = False
@@ -164,7 +206,7 @@ def register_user(user_type, name, user_id, password):
 
 # Show member interface
 def show_member_interface():
-    st.subheader(f"👤 Member: {st.session_state.current_user.name}")
+    st.subheader(f"👤 Member: {current_user().name}")
     
     col1, col2 = st.columns(2)
     with col1:
@@ -184,145 +226,374 @@ def show_member_interface():
         change_password_interface()
     
     if st.button("Logout"):
+        library.end_session(st.session_state.session_token)
         reset_session()
         st.rerun()
 
-# Show books for members
-def show_books_for_member():
-    books = st.session_state.library.show_books()
-    if books:
-        st.write("### Available Books:")
-        for book_id, book_info in books.items():
-            st.write(book_info)
-        
-        st.write("### Manage Loans")
+# Show one page of the catalog (or of the borrowable books) as a single table
+def show_books_page(key, available_only=False):
+    total = library.count_available() if available_only else library.count_books()
+    if total == 0:
+        return False
+    
+    pages = (total - 1) // PAGE_SIZE + 1
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > pages:   # The catalog shrank since the last rerun
+        st.session_state[page_key] = pages
+    
+    if available_only:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+        rows = library.show_available_books((page - 1) * PAGE_SIZE, PAGE_SIZE)
+    else:
         col1, col2 = st.columns(2)
         with col1:
-            st.session_state.borrow_book_id = st.number_input("Book ID to borrow", min_value=1, step=1)
-            if st.button("Borrow Book"):
-                try:
-                    book = st.session_state.library._Library__books.get(st.session_state.borrow_book_id)
-                    if book:
-                        if st.session_state.current_user.borrow_book(book):
-                            st.success(f"Book '{book.title}' borrowed successfully!")
-                            st.rerun()
-                    else:
-                        st.error("Book not found")
-                except ValueError as e:
-                    st.error(str(e))
-        
+            sort_by = st.selectbox("Sort by", Library.SORT_KEYS, key=f"{key}_sort",
+                                   format_func=lambda sort_key: sort_key.replace("_", " ").title())
         with col2:
-            st.session_state.return_book_id = st.number_input("Book ID to return", min_value=1, step=1)
-            if st.button("Return Book"):
-                try:
-                    book = st.session_state.library._Library__books.get(st.session_state.return_book_id)
-                    if book:
-                        if st.session_state.return_book_id in st.session_state.current_user._Member__borrowed_books:
-                            st.session_state.current_user.return_book(book)
-                            st.success(f"Book '{book.title}' returned successfully!")
-                            st.rerun()
-                        else:
-                            st.error("You didn't borrow this book")
-                    else:
-                        st.error("Book not found")
-                except ValueError as e:
-                    st.error(str(e))
+            page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=page_key)
+        rows = library.show_books_page((page - 1) * PAGE_SIZE, PAGE_SIZE, sort_by)
+    
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    st.caption(f"{total} books {'available' if available_only else 'in the library'}")
+    return True
+
+# Search the catalog by title or author
+def show_search_box(key):
+    query = st.text_input("Search by title or author", key=f"{key}_search")
+    if query.strip():
+        rows = library.show_search_results(query, PAGE_SIZE)
+        if rows:
+            st.dataframe(rows, hide_index=True, use_container_width=True)
+        else:
+            st.write("No books match your search.")
+
+# Runs a form action and reports it in `notice`, a container drawn above the form
+def run_action(notice, action, message):
+    try:
+        result = action()
+    except ValueError as e:
+        notice.error(str(e))
     else:
-        st.write("No books available in the library.")
+        notice.success(message(result) if callable(message) else message)
+
+# Every book by one author, served by the library's author index
+def show_author_filter(key):
+    author = st.text_input("Books by author (full name)", key=f"{key}_author")
+    if not author.strip():
+        return
+    total = library.count_books_by_author(author)
+    if total == 0:
+        st.write("No books by that author.")
+        return
+    pages = (total - 1) // PAGE_SIZE + 1
+    page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, step=1, key=f"{key}_author_page")
+    st.dataframe(library.show_books_by_author(author, (page - 1) * PAGE_SIZE, PAGE_SIZE),
+                 hide_index=True, use_container_width=True)
+    st.caption(f"{total} books by {author.strip()}")
+
+# Show books for members. A fragment: paging, searching and every loan/hold form rerun
+# only this panel, not the whole page. The forms are handled before the tables are
+# filled in (containers keep the layout), so an action needs no second rerun to show.
+@st.fragment
+def show_books_for_member():
+    member_id = current_user().member_id
+    notice, listing = st.container(), st.container()
+    
+    if library.count_books():
+        st.write("### Manage Loans")
+        col1, col2 = st.columns(2)
+        with col1, st.form("borrow_form", border=False):
+            borrow_book_id = st.number_input("Book ID to borrow", min_value=1, step=1)
+            if st.form_submit_button("Borrow Book"):
+                run_action(notice, lambda: library.borrow_book(member_id, borrow_book_id),
+                           lambda book: f"Book '{book.title}' borrowed successfully!")
+        
+        with col2, st.form("return_form", border=False):
+            return_book_id = st.number_input("Book ID to return", min_value=1, step=1)
+            if st.form_submit_button("Return Book"):
+                run_action(notice, lambda: library.return_book(member_id, return_book_id),
+                           lambda book: f"Book '{book.title}' returned successfully!")
+        
+        st.write("### Holds")
+        col1, col2 = st.columns(2)
+        with col1, st.form("hold_form", border=False):
+            hold_book_id = st.number_input("Book ID to place a hold on", min_value=1, step=1)
+            if st.form_submit_button("Place Hold"):
+                run_action(notice, lambda: library.place_hold(member_id, hold_book_id),
+                           lambda position: f"Hold placed. You are number {position} in the queue.")
+        
+        with col2, st.form("cancel_hold_form", border=False):
+            cancel_book_id = st.number_input("Book ID to cancel the hold on", min_value=1, step=1)
+            if st.form_submit_button("Cancel Hold"):
+                run_action(notice, lambda: library.cancel_hold(member_id, cancel_book_id), "Hold cancelled.")
+    
+    with listing:
+        show_search_box("member_books")
+        st.write("### Available Books:")
+        if not show_books_page("member_books", available_only=True):
+            st.write("No books available right now.")
+        
+        loans = library.show_member_loans(member_id)
+        if loans:
+            st.write("### My Loans")
+            st.dataframe(loans, hide_index=True, use_container_width=True)
+        
+        holds = library.show_member_holds(member_id)
+        if holds:
+            st.write("### My Holds")
+            st.dataframe(holds, hide_index=True, use_container_width=True)
 
 # Show librarian interface
 def show_librarian_interface():
-    st.subheader(f"👔 Librarian: {st.session_state.current_user.name}")
+    st.subheader(f"👔 Librarian: {current_user().name}")
     
-    col1, col2, col3 = st.columns(3)
+    col1, col2, col3, col4, col5 = st.columns(5)
     with col1:
         if st.button("View Books"):
             st.session_state.show_books = not st.session_state.show_books
             if st.session_state.show_books:
                 st.session_state.show_members = False
+                st.session_state.show_overdue = False
+                st.session_state.show_reports = False
     
     with col2:
         if st.button("View Members"):
             st.session_state.show_members = not st.session_state.show_members
             if st.session_state.show_members:
                 st.session_state.show_books = False
+                st.session_state.show_overdue = False
+                st.session_state.show_reports = False
     
     with col3:
+        if st.button("Overdue Loans"):
+            st.session_state.show_overdue = not st.session_state.show_overdue
+            if st.session_state.show_overdue:
+                st.session_state.show_books = False
+                st.session_state.show_members = False
+                st.session_state.show_reports = False
+    
+    with col4:
+        if st.button("Reports"):
+            st.session_state.show_reports = not st.session_state.show_reports
+            if st.session_state.show_reports:
+                st.session_state.show_books = False
+                st.session_state.show_members = False
+                st.session_state.show_overdue = False
+    
+    with col5:
         if st.button("Change Password"):
             st.session_state.change_password = not st.session_state.change_password
     
     if st.session_state.show_books:
         show_books_for_librarian()
+        show_bulk_import_export()
     
     if st.session_state.show_members:
         show_members_list()
     
+    if st.session_state.show_overdue:
+        show_overdue_loans()
+    
+    if st.session_state.show_reports:
+        show_circulation_reports()
+    
     if st.session_state.change_password:
         change_password_interface()
     
     if st.button("Logout"):
+        library.end_session(st.session_state.session_token)
         reset_session()
         st.rerun()
 
-# Show books for librarians
+# Show books for librarians. A fragment laid out like the member panel: the listing and
+# the add/remove forms rerun on their own, forms first.
+@st.fragment
 def show_books_for_librarian():
     st.write("### Book Management")
-    books = st.session_state.library.show_books()
-    if books:
-        st.write("#### Current Books in Library:")
-        for book_id, book_info in books.items():
-            st.write(book_info)
+    notice, listing = st.container(), st.container()
     
-    st.write("#### Add New Book")
-    st.session_state.new_book_title = st.text_input("Book Title")
-    st.session_state.new_book_author = st.text_input("Author")
-    st.session_state.new_book_id = st.number_input("Book ID", min_value=1, step=1)
+    with st.form("add_book_form", clear_on_submit=True):
+        st.write("#### Add New Book")
+        new_book_title = st.text_input("Book Title")
+        new_book_author = st.text_input("Author")
+        new_book_id = st.number_input("Book ID", min_value=1, step=1)
+        new_book_copies = st.number_input("Copies", min_value=1, max_value=Book.MAX_COPIES, step=1)
+        if st.form_submit_button("Add Book"):
+            run_action(notice, lambda: current_user().add_book(
+                Book(new_book_title, new_book_author, new_book_id, new_book_copies)), "Book added successfully!")
     
-    if st.button("Add Book"):
-        try:
-            new_book = Book(
-                st.session_state.new_book_title,
-                st.session_state.new_book_author,
-                st.session_state.new_book_id
-            )
-            st.session_state.current_user.add_book(new_book)
-            st.success("Book added successfully!")
-            st.rerun()
-        except ValueError as e:
-            st.error(str(e))
+    with st.form("add_copies_form"):
+        st.write("#### Add Copies")
+        col1, col2 = st.columns(2)
+        with col1:
+            copies_book_id = st.number_input("Book ID to add copies to", min_value=1, step=1)
+        with col2:
+            extra_copies = st.number_input("Copies to add", min_value=1, max_value=Book.MAX_COPIES, step=1)
+        if st.form_submit_button("Add Copies"):
+            run_action(notice, lambda: library.add_copies(copies_book_id, extra_copies),
+                       "Copies added successfully!")
+    
+    with st.form("remove_book_form"):
+        st.write("#### Remove Book")
+        remove_book_id = st.number_input("Book ID to remove", min_value=1, step=1)
+        if st.form_submit_button("Remove Book"):
+            run_action(notice, lambda: current_user().remove_book(remove_book_id), "Book removed successfully!")
     
-    st.write("#### Remove Book")
-    st.session_state.remove_book_id = st.number_input("Book ID to remove", min_value=1, step=1)
-    if st.button("Remove Book"):
+    with listing:
+        show_search_box("librarian_books")
+        show_author_filter("librarian_books")
+        st.write("#### Current Books in Library:")
+        if not show_books_page("librarian_books"):
+            st.write("No books in the library.")
+
+# Background import of an uploaded catalog file; progress is how much of the file was read
+def import_job(job, data, filename):
+    raw = io.BytesIO(data)
+    stream = io.TextIOWrapper(raw, encoding="utf-8-sig", newline="")   # -sig: drops the BOM Excel writes to "CSV UTF-8"
+    return import_books(library, stream, detect_format(filename), progress=lambda added, rejected: job.report(
+        raw.tell() / max(len(data), 1), f"{added} books added, {rejected} rows rejected"))
+
+# Background export of the whole catalog into memory, ready for the download button
+def export_job(job, export_format):
+    total = max(library.count_books(), 1)
+    buffer = io.StringIO()
+    export_books(library, buffer, export_format,
+                 progress=lambda written: job.report(written / total, f"{written} books written"))
+    return export_format, buffer.getvalue()
+
+# Bulk catalog import/export (CSV or JSON Lines), a fragment of its own next to the book
+# panel. Both run as background jobs: the buttons only submit them, and show_job()
+# follows their progress in a nested fragment that reruns the whole page once a job ends.
+@st.fragment
+def show_bulk_import_export():
+    st.write("#### Bulk Import")
+    uploaded = st.file_uploader("Catalog file (CSV or JSON Lines with book_id, title, author and optional copies)",
+                                type=["csv", "jsonl", "ndjson"])
+    if uploaded is not None and st.button("Import Books"):
         try:
-            st.session_state.current_user.remove_book(st.session_state.remove_book_id)
-            st.success("Book removed successfully!")
-            st.rerun()
+            detect_format(uploaded.name)
         except ValueError as e:
             st.error(str(e))
+        else:
+            st.session_state.import_job = jobs.submit(f"Import {uploaded.name}", import_job,
+                                                      uploaded.getvalue(), uploaded.name)
+    show_job("import_job", show_import_result)
+    
+    st.write("#### Export Catalog")
+    export_format = st.selectbox("Export format", FORMATS)
+    if st.button("Prepare Export"):
+        st.session_state.export_job = jobs.submit(f"Export {export_format}", export_job, export_format)
+    show_job("export_job", show_export_result)
+    
+    if jobs.jobs():
+        with st.expander("Background jobs"):
+            st.dataframe([job.as_row() for job in jobs.jobs()], hide_index=True, use_container_width=True)
+
+def show_import_result(result):
+    added, problems = result
+    st.success(f"Imported {added} books.")
+    if problems:
+        st.warning(f"{len(problems)} rows were rejected:")
+        st.dataframe([{"Line": line, "Problem": message} for line, message in problems],
+                     hide_index=True, use_container_width=True)
+
+def show_export_result(result):
+    export_format, data = result
+    st.download_button("Download Catalog", data, file_name=f"catalog.{export_format}",
+                       mime="text/csv" if export_format == "csv" else "application/jsonl")
+
+# Shows the session's job stored under `key`: live progress while it runs, then its outcome
+def show_job(key, show_result):
+    job = jobs.get(st.session_state.get(key))
+    if job is None:
+        return
+    if not job.finished:
+        follow_job(key)
+    elif job.status == DONE:
+        show_result(job.result)
+    elif job.status == CANCELLED:
+        st.warning(f"{job.name} was cancelled. {job.message}")
+    else:
+        st.error(f"{job.name} failed: {job.error}")
+
+# Polls a running job once a second without rerunning the page; a full rerun once it finishes
+@st.fragment(run_every=1)
+def follow_job(key):
+    job = jobs.get(st.session_state.get(key))
+    if job is None or job.finished:
+        st.rerun()
+    st.progress(job.progress or 0.0, text=f"{job.name}: {job.message or job.status}")
+    if st.button("Cancel", key=f"{key}_cancel", disabled=job.cancel_requested):
+        jobs.cancel(job.job_id)
+
+# Show overdue loans, most overdue first
+def show_overdue_loans():
+    st.write("### Overdue Loans")
+    rows = library.show_overdue_loans(limit=PAGE_SIZE * 5)
+    if rows:
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        st.caption(f"{library.count_open_loans()} loans open")
+    else:
+        st.write("No overdue loans.")
+
+# Circulation dashboard: most borrowed titles, author demand, member activity and daily utilisation
+@st.fragment
+def show_circulation_reports():
+    st.write("### Circulation Reports")
+    stats = get_stats()
+    stats.refresh()
+    days = st.selectbox("Period", (7, 30, 90, 365), index=1, format_func=lambda days: f"Last {days} days")
+    daily = stats.daily(days)
+    if daily.empty:
+        st.write("No loans yet.")
+        return
+    st.write("#### Utilisation")
+    st.line_chart(daily["Utilisation"])
+    st.caption(f"Share of the {library.count_copies()} copies out on loan at the end of each day")
+    st.write("#### Loans per Day")
+    st.bar_chart(daily["Loans"])
+    col1, col2 = st.columns(2)
+    with col1:
+        st.write("#### Most Borrowed Titles")
+        st.dataframe(stats.top_titles(), hide_index=True, use_container_width=True)
+    with col2:
+        st.write("#### Author Demand")
+        st.dataframe(stats.author_demand(), hide_index=True, use_container_width=True)
+    st.write("#### Most Active Members")
+    st.dataframe(stats.member_activity(), hide_index=True, use_container_width=True)
 
 # Show members list
 def show_members_list():
     st.write("### Members List")
-    members = st.session_state.library.show_members()
+    name = st.text_input("Find member by name")
+    if name.strip():          # Answered by the name index, without listing everyone
+        found = library.show_found_members(name)
+        if found:
+            st.dataframe(found, hide_index=True, use_container_width=True)
+        else:
+            st.write("No member with that name.")
+        return
+    members = library.show_members()
     if members:
         for member_id, member_name in members.items():
             st.write(f"{member_name} (ID: {member_id})")
     else:
         st.write("No members registered.")
 
-# Change password interface
+# Change password interface, a form in its own fragment so typing never reruns the page
+@st.fragment
 def change_password_interface():
-    st.write("### Change Password")
-    new_password = st.text_input("New Password", type="password")
-    if st.button("Update Password"):
-        if len(new_password) < 6:
-            st.error("Password must be at least 6 characters")
-        else:
-            st.session_state.current_user.password = new_password
-            st.success("Password updated successfully!")
-            st.session_state.change_password = False
-            st.rerun()
+    with st.form("change_password_form", clear_on_submit=True):
+        st.write("### Change Password")
+        new_password = st.text_input("New Password", type="password")
+        if st.form_submit_button("Update Password"):
+            try:
+                library.change_password(current_user(), new_password)
+            except ValueError as e:
+                st.error(str(e))
+            else:
+                st.session_state.change_password = False
+                st.rerun()    # Full rerun: the panel closes
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,582 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import entendimiento2
+from entendimiento2 import Book, Library, Member, hash_password
+from ratelimit import RateLimiter
+from sharding import ProcessShard, ShardedLibrary
+from storage import JournalStorage, SQLiteStorage
+
+# Benchmarks for the domain model and the Streamlit request path:
+#   python bench.py model [--sizes 10,1000,100000] [--save base.json | --compare base.json]
+#   python bench.py app [--books 100000]
+#   python bench.py sessions [--books 100000] [--sessions 20]   (memory per Streamlit session)
+#   python bench.py stress | login | memory
+#   python bench.py login [--threads 16]   (latency, then an attack-like burst)
+#   python bench.py analytics [--operations 200000]
+#   python bench.py recovery [--books 1000000]
+#   python bench.py shards [--books 100000] [--shards 4]
+# Results are seconds per operation (bytes per session for sessions); --compare fails
+# (exit 1) on any hot path that got more than --tolerance slower, or bigger, than the saved run.
+
+SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+def timed(function, repeat=1):         # Seconds per call of function().
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def build_library(books, members, storage=None):    # Catalog of `books` titles and `members` members, built in bulk.
+    library = Library(storage)
+    library.add_books([Book(f"Title {book_id}", f"Author {book_id % 5000}", book_id) for book_id in range(1, books + 1)])
+    password = hash_password("secret123")    # Hashed once: the suites below are not measuring the KDF
+    for member_id in range(1, members + 1):
+        library.add_member(Member(f"Member {member_id}", password, member_id, hashed=True))
+    return library
+
+
+# Concurrent borrow/return/hold stress test: many threads hammer a small shared
+# catalog of one- to three-copy titles while another adds and removes books and
+# reader threads render every view the app shows (listings, searches, author
+# pages, a member's loans and holds). Then the library's invariants are checked:
+# copies against loans, the ledger against the members' books, and no hold left
+# waiting on a copy on the shelf.
+def stress_loans(threads=16, operations=2000, books=20, members=10, readers=2):
+    library = Library()
+    for book_id in range(books):
+        library.add_book(Book(f"Title {book_id}", f"Author {book_id % 10}", book_id, 1 + book_id % 3))
+    for member_id in range(members):
+        library.add_member(Member(f"Member {member_id}", "secret123", member_id))
+    writing = True
+
+    def worker(seed):
+        rng = random.Random(seed)
+        done = 0
+        for _ in range(operations):
+            member_id, book_id = rng.randrange(members), rng.randrange(books)
+            try:
+                if book_id in library.get_member(member_id).borrowed_books:
+                    library.return_book(member_id, book_id)
+                elif library.get_book(book_id).availability:
+                    library.borrow_book(member_id, book_id)
+                elif rng.random() < 0.2:
+                    library.cancel_hold(member_id, book_id)
+                else:             # Queue for it; returns hand the copy over under both members' locks
+                    library.place_hold(member_id, book_id)
+                done += 1
+            except ValueError:    # Book already lent, limit reached, queue full or lost a race: all expected
+                pass
+        return done
+
+    def churn():                  # Books added in batches and removed one by one, never lent: the catalog keeps changing
+        next_id = books
+        while writing:
+            batch = [Book(f"Title {book_id}", f"Author {book_id % 10}", book_id) for book_id in range(next_id, next_id + 5)]
+            library.add_books(batch)
+            for book in batch:
+                library.remove_book(book.book_id)
+            next_id += len(batch)
+
+    def reader(seed):             # The app's views must never fail or see a torn page while loans and the catalog change
+        rng = random.Random(seed)
+        reads = 0
+        while writing:
+            ids = [row["ID"] for row in library.show_available_books(0, books)]
+            assert ids == sorted(set(ids)), f"available page out of order: {ids}"
+            assert len(library.search_books(f"title {seed % books}", books)) >= 1
+            library.count_available()
+            member_id = rng.randrange(members)
+            library.show_member_loans(member_id)
+            library.show_member_holds(member_id)
+            library.books_page(rng.randrange(books), 10)
+            library.books_page(0, 10, sort_by="title")
+            library.books_by_author(f"Author {seed % 10}", 1, 5)
+            reads += 1
+        return reads
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)       # Threads swap far more often than the default 5 ms, so races actually interleave
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            with ThreadPoolExecutor(threads + readers + 1) as pool:
+                reading = [pool.submit(reader, seed) for seed in range(readers)]
+                churning = pool.submit(churn)
+                try:
+                    completed = sum(pool.map(worker, range(threads)))
+                finally:
+                    writing = False   # Stops the readers and the churn even if a writer failed
+                reads = sum(future.result() for future in reading)
+                churning.result()
+            elapsed = time.perf_counter() - start
+    finally:
+        sys.setswitchinterval(switch_interval)
+
+    lent = {}                         # {book_id: {copy: member_id}}
+    for member_id in range(members):
+        member = library.get_member(member_id)
+        assert len(member.borrowed_books) <= Member.BORROW_LIMIT, f"member {member_id} over the limit"
+        for book_id, copy in member.borrowed_copies.items():
+            assert copy not in lent.setdefault(book_id, {}), f"copy {copy} of book {book_id} lent twice"
+            lent[book_id][copy] = member_id
+            loan = library.open_loan(member_id, book_id)
+            assert loan is not None and loan.copy == copy, f"no ledger entry for member {member_id}, book {book_id}"
+        for hold in library.show_member_holds(member_id):
+            assert not library.get_book(hold["ID"]).availability, f"member {member_id} waits on book {hold['ID']} on the shelf"
+            assert hold["ID"] not in member.borrowed_books, f"member {member_id} holds a book they have"
+    for book_id in range(books):
+        book = library.get_book(book_id)
+        assert book.copies - book.available_copies == len(lent.get(book_id, ())), f"book {book_id} out of sync"
+    open_loans = sum(map(len, lent.values()))
+    assert library.count_open_loans() == open_loans, "ledger and members disagree on open loans"
+    assert sum(loan[6] is None for loan in library.storage.load_loans()) == open_loans, "storage ledger out of sync"
+    available = [book_id for book_id in range(books) if library.get_book(book_id).availability]
+    assert library.count_available() == len(available)
+    assert [row["ID"] for row in library.show_available_books(0, books)] == available
+
+    attempts = threads * operations
+    print(f"stress: {threads} threads, {attempts} attempts, {completed} borrows/returns/holds "
+          f"in {elapsed:.2f}s ({attempts / elapsed:,.0f} ops/s), {reads} reads by {readers} readers, invariants hold")
+
+
+# Login latency at the configured scrypt cost: the KDF runs once per login,
+# after which every rerun resolves the session token with a dict lookup.
+def login_latency(attempts=20, cost=None):
+    if cost:
+        entendimiento2.SCRYPT_COST = cost
+    library = Library(login_limiter=RateLimiter(capacity=float("inf")))   # Measuring the KDF, not the lockout
+    library.add_member(Member("Alice", "secure123", 1001))
+
+    ok = timed(lambda: library.authenticate("Member", 1001, "secure123"), attempts)
+    wrong = timed(lambda: library.authenticate("Member", 1001, "wrong-password"), attempts)
+    unknown = timed(lambda: library.authenticate("Member", 9999, "secure123"), attempts)
+    token = library.authenticate("Member", 1001, "secure123")
+    cached = timed(lambda: library.session_user(token), 100000)
+    print(f"login: scrypt N={entendimiento2.SCRYPT_COST}: correct {ok * 1000:.1f} ms, wrong {wrong * 1000:.1f} ms, "
+          f"unknown ID {unknown * 1000:.1f} ms, cached session lookup {cached * 1e6:.2f} µs")
+
+
+# Password guessing: attacker threads cycle wrong passwords over a few member
+# IDs, each attempt from a fresh client session (a few hundred requests per
+# second each, as over HTTP), while one real member logs in every 100 ms. Run without and with the login rate limiter: with it, only the
+# first few attempts per ID reach the KDF and the member's login stays fast.
+def login_burst(attackers=16, seconds=6.0, targets=5, pause=0.005):
+    for label, limiter in (("unlimited", RateLimiter(capacity=float("inf"))), ("rate-limited", RateLimiter())):
+        library = Library(login_limiter=limiter)
+        password = hash_password("secret123")
+        for member_id in range(1, targets + 1):
+            library.add_member(Member(f"Member {member_id}", password, member_id, hashed=True))
+        library.add_member(Member("Alice", "secure123", 1001))
+        deadline = time.perf_counter() + seconds
+
+        def attacker(seed):           # (wrong passwords checked, attempts throttled)
+            rng = random.Random(seed)
+            rejected = throttled = 0
+            while time.perf_counter() < deadline:
+                try:
+                    library.authenticate("Member", rng.randint(1, targets), "guess", client=rng.random())
+                    rejected += 1
+                except ValueError:    # Throttled before the KDF
+                    throttled += 1
+                time.sleep(pause)
+            return rejected, throttled
+
+        latencies = []
+        with ThreadPoolExecutor(attackers) as pool:
+            futures = [pool.submit(attacker, seed) for seed in range(attackers)]
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                assert library.authenticate("Member", 1001, "secure123", client="alice") is not None
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.1)
+        rejected, throttled = map(sum, zip(*(future.result() for future in futures)))
+        latencies.sort()
+        print(f"login burst, {label}: {attackers} attackers, {rejected:,} wrong passwords checked, "
+              f"{throttled:,} throttled; member login p50 {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms over {len(latencies)} logins, {len(limiter)} buckets")
+
+
+# Resident cost of the catalog: bytes per book (objects plus every index) and
+# the speed of ID lookups and full iteration.
+def catalog_memory(books=100000):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    library = Library()
+    library.add_books([Book(f"Title {book_id}", f"Author {book_id % 5000}", book_id) for book_id in range(books)])
+    per_book = (tracemalloc.get_traced_memory()[0] - before) / books
+    tracemalloc.stop()
+
+    ids = list(range(books))
+    random.Random(0).shuffle(ids)
+    start = time.perf_counter()
+    for book_id in ids:
+        library.get_book(book_id).availability
+    lookup = (time.perf_counter() - start) / books
+    start = time.perf_counter()
+    after_id = None
+    while True:
+        page = library.books_page(limit=1000, after_id=after_id)
+        if not page:
+            break
+        after_id = page[-1].book_id
+    iteration = time.perf_counter() - start
+    print(f"memory: {books} books, {per_book:,.0f} bytes/book, lookup {lookup * 1e9:,.0f} ns, "
+          f"paged iteration {iteration * 1000:,.1f} ms")
+
+
+# Circulation reports: ingesting the whole loan history once, then the incremental
+# refresh and the dashboard queries a librarian's report view runs on each rerun.
+def analytics_suite(loans=200000, books=100000, members=10000):
+    from analytics import CirculationStats    # numpy/pandas are only needed here
+
+    library = build_library(books, members)
+    rng = random.Random(0)
+    now = time.time() - 365 * 86400
+
+    def circulate(count):             # Borrows, returning the member's oldest loan at the borrowing limit
+        nonlocal now
+        for _ in range(count):
+            now += 60
+            member = library.get_member(rng.randint(1, members))
+            if len(member.borrowed_books) == Member.BORROW_LIMIT:
+                library.return_book(member.member_id, next(iter(member.borrowed_books)), now=now)
+            try:
+                library.borrow_book(member.member_id, rng.randint(1, books), now=now)
+            except ValueError:
+                pass
+
+    circulate(loans)
+    stats = CirculationStats(library)
+    first = timed(stats.refresh)
+    circulate(100)
+    incremental = timed(stats.refresh)
+    dashboard = timed(lambda: (stats.top_titles(), stats.author_demand(), stats.member_activity(), stats.daily(30)), 20)
+    print(f"analytics: {library.count_open_loans()} open of {len(stats.loan_frame())} loans: "
+          f"full ingest {first * 1000:,.1f} ms, refresh after 100 loans {incremental * 1000:,.2f} ms, "
+          f"dashboard {dashboard * 1000:,.2f} ms")
+
+
+# Restart time of a library persisted in a journal directory: replaying the whole
+# journal, loading a compacted snapshot, and a snapshot plus a journal tail, next
+# to the same catalog in SQLite. Each is split into opening the storage,
+# rebuilding the Library's in-memory indexes from it, and the search index that
+# is built after startup.
+def recovery_suite(books=1000000, tail=10000):
+    def restart(open_storage):
+        start = time.perf_counter()
+        storage = open_storage()
+        opened = time.perf_counter()
+        library = Library(storage)
+        built = time.perf_counter()
+        library.build_search_index()  # Built on first search (in the app: in the background after startup)
+        indexed = time.perf_counter()
+        storage.close()
+        return opened - start, built - opened, indexed - built, library.count_books()
+
+    def report(name, timings):
+        opened, built, indexed, count = timings
+        print(f"{name:<26} {count:>9,} books: storage {opened:6.2f} s, library {built:6.2f} s, "
+              f"ready {opened + built:6.2f} s, search index {indexed:6.2f} s")
+
+    with tempfile.TemporaryDirectory() as directory:
+        journal = os.path.join(directory, "library.journal")
+        storage = JournalStorage(journal, compact_every=books)    # No compaction until asked
+        build_library(books, 1000, storage)
+        storage.close()
+        size = sum(os.path.getsize(os.path.join(journal, name)) for name in os.listdir(journal))
+        replay = restart(lambda: JournalStorage(journal))
+
+        storage = JournalStorage(journal)
+        storage.compact()
+        storage.close()
+        snapshot = restart(lambda: JournalStorage(journal))
+
+        storage = JournalStorage(journal, compact_every=books)
+        library = Library(storage)
+        for book_id in range(books + 1, books + tail + 1):   # One journal record each, as the app writes them
+            library.add_book(Book(f"Title {book_id}", "Tail Author", book_id))
+        storage.close()
+        with_tail = restart(lambda: JournalStorage(journal))
+
+        database = os.path.join(directory, "library.db")
+        storage = SQLiteStorage(database)
+        build_library(books, 1000, storage)
+        storage.close()
+        sqlite = restart(lambda: SQLiteStorage(database))
+
+    print(f"recovery: journal of {books:,} books is {size / 2 ** 20:,.1f} MiB")
+    report("journal replay", replay)
+    report("snapshot", snapshot)
+    report(f"snapshot + {tail:,} records", with_tail)
+    report("sqlite", sqlite)
+
+
+# The same catalog in one Library and hash-partitioned over shard processes:
+# the merged pages and search hits must match the single Library's, then the
+# cost of the fan-out is timed next to the direct calls.
+def shard_suite(books=100000, shards=4, operations=200):
+    def catalog():                    # Fresh objects per library: a Book already in a Library does not pickle
+        return [Book(f"Title {book_id}", f"Author {book_id % 5000}", book_id, 1 + book_id % 3)
+                for book_id in range(1, books + 1)]
+
+    single = Library()
+    sharded = ShardedLibrary([ProcessShard() for _ in range(shards)])
+    try:
+        start = time.perf_counter()
+        single.add_books(catalog())
+        loaded_single = time.perf_counter() - start
+        start = time.perf_counter()
+        sharded.add_books(catalog())
+        loaded_sharded = time.perf_counter() - start
+        password = hash_password("secret123")
+        for member_id in range(1, 101):
+            single.add_member(Member(f"Member {member_id}", password, member_id, hashed=True))
+            sharded.add_member(Member(f"Member {member_id}", password, member_id, hashed=True))
+        rng = random.Random(0)
+        for member_id in range(1, 101):   # Some loans, so availability differs from book to book
+            for book_id in rng.sample(range(1, books + 1), min(3, books)):
+                with contextlib.suppress(ValueError):
+                    single.borrow_book(member_id, book_id)
+                    sharded.borrow_book(member_id, book_id)
+
+        for sort_by in Library.SORT_KEYS:
+            assert sharded.show_books_page(books // 2, 20, sort_by) == single.show_books_page(books // 2, 20, sort_by), sort_by
+        assert sharded.show_books_page(limit=20, after_id=books // 3) == single.show_books_page(limit=20, after_id=books // 3)
+        assert sharded.show_available_books(100, 20) == single.show_available_books(100, 20)
+        assert sharded.show_books_by_author("Author 42", 5, 10) == single.show_books_by_author("Author 42", 5, 10)
+        assert sharded.count_books_by_author("Author 42") == single.count_books_by_author("Author 42")
+        probe = max(books // 2, 1)    # A book that exists whatever --books is
+        for query in (f"title {probe}", f"author {probe % 5000}"):   # Same best hit and the same hits; equal scores may come in any order
+            hits = [row["ID"] for row in sharded.show_search_results(query, 50)]
+            expected = [row["ID"] for row in single.show_search_results(query, 50)]
+            assert hits[0] == expected[0] and sorted(hits) == sorted(expected), query
+        assert (sharded.count_books(), sharded.count_available(), sharded.count_copies(), sharded.count_open_loans()) == \
+               (single.count_books(), single.count_available(), single.count_copies(), single.count_open_loans())
+
+        def loan_round_trip(library):
+            member_id, book_id = rng.randint(1, 100), rng.randint(1, books)
+            with contextlib.suppress(ValueError):
+                library.borrow_book(member_id, book_id)
+                library.return_book(member_id, book_id)
+
+        print(f"shards: {books:,} books, {shards} shard processes, merged pages and counts match one Library; "
+              f"bulk load {loaded_single:.2f} s in one Library, {loaded_sharded:.2f} s sharded")
+        for name, call in (("show_books_page", lambda library: library.show_books_page(books // 2, 20)),
+                           ("show_books_page title", lambda library: library.show_books_page(books // 2, 20, "title")),
+                           ("show_books_page after_id", lambda library: library.show_books_page(limit=20, after_id=books // 2)),
+                           ("show_search_results", lambda library: library.show_search_results("title 42")),
+                           ("count_available", lambda library: library.count_available()),
+                           ("borrow_return", loan_round_trip)):
+            direct, fanned = timed(lambda: call(single), operations), timed(lambda: call(sharded), operations)
+            print(f"{name:<26} one Library {direct * 1e6:>10,.1f} µs, sharded {fanned * 1e6:>10,.1f} µs")
+    finally:
+        sharded.close()
+
+
+# Hot paths of the domain model at each catalog size.
+def model_suite(sizes=SIZES, operations=1000):
+    results = {}
+    rng = random.Random(0)
+    for size in sizes:
+        members = min(size, 10000)
+        with contextlib.redirect_stdout(io.StringIO()):
+            library = build_library(size, members)
+            library.build_search_index()    # Steady state: the app builds it in the background at startup
+            next_id = size + 1
+
+            def add_book():
+                nonlocal next_id
+                library.add_book(Book(f"New title {next_id}", "New Author", next_id))
+                next_id += 1
+
+            def loan_round_trip():
+                member_id, book_id = rng.randint(1, members), rng.randint(1, size)
+                try:
+                    library.borrow_book(member_id, book_id)
+                    library.return_book(member_id, book_id)
+                except ValueError:
+                    pass
+
+            results[f"show_books@{size}"] = timed(library.show_books)                 # Renders every book
+            results[f"show_books_cached@{size}"] = timed(library.show_books, operations)   # Unchanged: the same snapshot
+            results[f"show_books_after_loan@{size}"] = timed(lambda: (loan_round_trip(), library.show_books()), operations)
+            results[f"show_books_page@{size}"] = timed(lambda: library.show_books_page(size // 2, 20), operations)
+            results[f"show_members@{size}"] = timed(library.show_members, max(1, 1000 // members))
+            results[f"search_books@{size}"] = timed(lambda: library.search_books("title 4"), operations)
+            results[f"books_by_author@{size}"] = timed(lambda: library.books_by_author("author 4"), operations)
+            results[f"find_members@{size}"] = timed(lambda: library.find_members(f"member {members // 2}"), operations)
+            results[f"borrow_return@{size}"] = timed(loan_round_trip, operations)
+            results[f"add_book@{size}"] = timed(add_book, operations)    # Last, so it doesn't grow the catalog under the others
+        results[f"authenticate@{size}"] = timed(lambda: library.authenticate("Member", 1, "secret123"), 5)
+        for name in ("add_book", "show_books", "show_books_cached", "show_books_after_loan", "show_books_page", "show_members", "search_books",
+                     "books_by_author", "find_members", "borrow_return", "authenticate"):
+            print(f"{name + '@' + str(size):<26} {results[f'{name}@{size}'] * 1e6:>14,.1f} µs")
+    return results
+
+
+# Headless Streamlit run of app.py: log in as the sample member and time each rerun.
+def button(app, label):               # AppTest widget by label
+    return next(widget for widget in app.button if widget.label == label)
+
+
+def number_input(app, label):
+    return next(widget for widget in app.number_input if widget.label == label)
+
+
+def app_suite(books=100000, reruns=20):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("app: streamlit is not installed, skipping")
+        return {}
+
+    book_ids = iter(random.Random(0).sample(range(1, books + 1), reruns))
+
+    def borrow_and_return():          # One interaction each with the borrow and return forms
+        book_id = next(book_ids)
+        number_input(app, "Book ID to borrow").set_value(book_id)
+        button(app, "Borrow Book").click().run()
+        number_input(app, "Book ID to return").set_value(book_id)
+        button(app, "Return Book").click().run()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LIBRARY_DB"] = os.path.join(directory, "bench.db")
+        storage = SQLiteStorage(os.environ["LIBRARY_DB"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            library = build_library(books, 0, storage)
+            library.add_member(Member("Alice", "secure123", 1001))    # The sample member the suite logs in as
+        storage.close()
+
+        app = AppTest.from_file("app.py", default_timeout=60)
+        cold = timed(app.run)
+        app.radio[0].set_value("Member")
+        app.number_input[0].set_value(1001)
+        app.text_input[0].input("secure123")
+        login = timed(button(app, "Login").click().run)
+        button(app, "View Available Books").click().run()
+        rerun = timed(app.run, reruns)
+        page = timed(lambda: app.number_input(key="member_books_page").increment().run(), reruns)
+        loan = timed(borrow_and_return, reruns) / 2
+
+    results = {f"app_cold_start@{books}": cold, f"app_login@{books}": login,
+               f"app_rerun@{books}": rerun, f"app_next_page@{books}": page, f"app_loan_form@{books}": loan}
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds * 1000:>14,.1f} ms")
+    return results
+
+
+# Memory held per Streamlit session: N member sessions logged in and showing the
+# available books, all kept alive, under tracemalloc. The first session pays for
+# the shared Library and the imports, so it is left out of the per-session figure.
+def session_memory(books=100000, sessions=20):
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        print("sessions: streamlit is not installed, skipping")
+        return {}
+
+    def open_session():
+        app = AppTest.from_file("app.py", default_timeout=60)
+        app.run()
+        app.radio[0].set_value("Member")
+        app.number_input[0].set_value(1001)
+        app.text_input[0].input("secure123")
+        button(app, "Login").click().run()
+        button(app, "View Available Books").click().run()
+        return app
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.environ["LIBRARY_DB"] = os.path.join(directory, "bench.db")
+        storage = SQLiteStorage(os.environ["LIBRARY_DB"])
+        with contextlib.redirect_stdout(io.StringIO()):
+            library = build_library(books, 0, storage)
+            library.add_member(Member("Alice", "secure123", 1001))
+        storage.close()
+
+        tracemalloc.start()
+        apps = [open_session()]
+        gc.collect()
+        base = tracemalloc.get_traced_memory()[0]
+        apps.extend(open_session() for _ in range(sessions - 1))
+        gc.collect()
+        per_session = (tracemalloc.get_traced_memory()[0] - base) / max(sessions - 1, 1)
+        tracemalloc.stop()
+
+    results = {f"session_bytes@{books}": per_session}
+    print(f"sessions: {sessions} kept alive over {books} books, {per_session / 1024:,.1f} KiB per session")
+    return results
+
+
+def compare(results, baseline_file, tolerance):   # Names every benchmark slower than the baseline by more than tolerance.
+    with open(baseline_file) as stream:
+        baseline = json.load(stream)
+    regressions = [name for name, seconds in results.items()
+                   if name in baseline and seconds > baseline[name] * (1 + tolerance)]
+    for name in regressions:
+        if "bytes" in name:
+            print(f"REGRESSION {name}: {baseline[name]:,.0f} B -> {results[name]:,.0f} B")
+        else:
+            print(f"REGRESSION {name}: {baseline[name] * 1e6:,.1f} µs -> {results[name] * 1e6:,.1f} µs")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library benchmarks")
+    parser.add_argument("suite", choices=["model", "app", "sessions", "stress", "login", "memory", "analytics", "recovery",
+                                          "shards"])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--scrypt-cost", type=int, help="scrypt N for the login suite")
+    parser.add_argument("--books", type=int, help="Catalog size for the app, memory, shards (100000) and recovery (1000000) suites")
+    parser.add_argument("--shards", type=int, default=4, help="Shard processes for the shards suite")
+    parser.add_argument("--sessions", type=int, default=20, help="Streamlit sessions kept alive by the sessions suite")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Catalog sizes for the model suite")
+    parser.add_argument("--save", help="Write the model/app/sessions results to this JSON file")
+    parser.add_argument("--compare", help="Compare the model/app/sessions results with this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown for --compare")
+    args = parser.parse_args(argv)
+
+    if args.suite in ("model", "app", "sessions"):
+        if args.suite == "model":
+            results = model_suite([int(size) for size in args.sizes.split(",")])
+        elif args.suite == "app":
+            results = app_suite(args.books or 100000)
+        else:
+            results = session_memory(args.books or 100000, args.sessions)
+        if args.save:
+            with open(args.save, "w") as stream:
+                json.dump(results, stream, indent=2)
+        if args.compare:
+            stress_loans(args.threads, args.operations)   # A faster build must still be a correct one
+            if compare(results, args.compare, args.tolerance):
+                return 1
+    elif args.suite == "stress":
+        stress_loans(args.threads, args.operations)
+    elif args.suite == "login":
+        login_latency(cost=args.scrypt_cost)
+        login_burst(args.threads)
+    elif args.suite == "memory":
+        catalog_memory(args.books or 100000)
+    elif args.suite == "analytics":
+        analytics_suite(args.operations)
+    elif args.suite == "recovery":
+        recovery_suite(args.books or 1000000)
+    elif args.suite == "shards":
+        shard_suite(args.books or 100000, args.shards)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
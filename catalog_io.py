@@ -0,0 +1,124 @@
+import csv
+import json
+from itertools import islice
+
+from entendimiento2 import Book
+
+# Streaming bulk import/export of the catalog in CSV or JSON Lines.
+# Rows are read and written one chunk at a time, so a 200k-title file never
+# has to fit in memory and the catalog is written to storage in batches.
+
+FIELDS = ("book_id", "title", "author", "copies")    # copies is optional on import (default 1)
+FORMATS = ("csv", "jsonl")
+BATCH_SIZE = 1000
+
+
+def detect_format(filename):          # Picks the format from the file extension (.csv, .jsonl/.ndjson).
+    name = filename.lower()
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Unsupported file type: {filename} (use .csv or .jsonl)")
+
+
+def read_rows(stream, fmt):           # Yields (line_number, row) pairs from a text stream.
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if reader.fieldnames:         # A byte-order mark left by a stream not opened as utf-8-sig
+            reader.fieldnames[0] = reader.fieldnames[0].lstrip("\ufeff")
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except json.JSONDecodeError:
+                yield line_number, line    # parse_row() reports it as not being a JSON object
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _whole_number(row, field):       # row[field] as an int; floats and strings must hold a whole number (1.9 is refused, not truncated).
+    value = row.get(field)
+    if isinstance(value, str):
+        try:
+            return int(value)         # Digits only: int("1.9") fails rather than truncating
+        except ValueError:
+            pass
+    elif isinstance(value, float) and value.is_integer():
+        return int(value)
+    elif isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError(f"Invalid {field}: {row.get(field)!r}")
+
+
+def parse_row(row):                   # Validates one row and builds its Book; raises ValueError with the reason.
+    if not isinstance(row, dict):
+        raise ValueError("Row is not a JSON object.")
+    book_id = _whole_number(row, "book_id")
+    if book_id < 1:
+        raise ValueError(f"Invalid book_id: {book_id}")
+    title = str(row.get("title") or "").strip()
+    author = str(row.get("author") or "").strip()
+    if not title:
+        raise ValueError("Missing title.")
+    if not author:
+        raise ValueError("Missing author.")
+    copies = 1 if row.get("copies") in (None, "") else _whole_number(row, "copies")   # Only a missing value defaults, never 0
+    if not 1 <= copies <= Book.MAX_COPIES:
+        raise ValueError(f"Invalid copies: {copies} (1 to {Book.MAX_COPIES})")
+    return Book(title, author, book_id, copies)
+
+
+def import_books(library, stream, fmt, batch_size=BATCH_SIZE, progress=None):
+    # Streams rows into the library in batches. Returns (added, problems), problems being
+    # [(line_number, message)] for every rejected row, duplicates included.
+    added, problems = 0, []
+    rows = read_rows(stream, fmt)
+    while True:
+        chunk = list(islice(rows, batch_size))
+        if not chunk:
+            break
+        books, lines = [], {}
+        for line_number, row in chunk:
+            try:
+                book = parse_row(row)
+            except ValueError as e:
+                problems.append((line_number, str(e)))
+                continue
+            books.append(book)
+            lines.setdefault(book.book_id, []).append(line_number)
+        duplicates = library.add_books(books)
+        for book_id in duplicates:
+            problems.append((lines[book_id].pop(), f"Book ID {book_id} is already in the library."))
+        added += len(books) - len(duplicates)
+        if progress is not None:
+            progress(added, len(problems))
+    problems.sort()
+    return added, problems
+
+
+def export_books(library, stream, fmt, batch_size=BATCH_SIZE, progress=None):   # Writes the catalog in book_id order, one page at a time.
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format: {fmt}")
+    writer = csv.DictWriter(stream, FIELDS) if fmt == "csv" else None
+    if writer is not None:
+        writer.writeheader()
+    written, after_id = 0, None
+    while True:
+        page = library.books_page(limit=batch_size, after_id=after_id)
+        if not page:
+            return written
+        for book in page:
+            record = {"book_id": book.book_id, "title": book.title, "author": book.author, "copies": book.copies}
+            if writer is not None:
+                writer.writerow(record)
+            else:
+                stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        written += len(page)
+        after_id = page[-1].book_id
+        if progress is not None:
+            progress(written)
@@ -0,0 +1,171 @@
+import argparse
+import logging
+import os
+import sys
+
+from catalog_io import detect_format, export_books, import_books
+from entendimiento2 import EVENTS, Book, Librarian, Library, Member
+from metrics import EventFormatter
+from storage import open_storage
+
+# Command-line entry point working on the same storage (--db) as the Streamlit app:
+#   python cli.py list [--available] [--search QUERY] [--page 2]
+#   python cli.py borrow MEMBER_ID BOOK_ID / python cli.py return MEMBER_ID BOOK_ID
+#   python cli.py import books.csv / python cli.py export catalog.jsonl
+#   python cli.py bench model --sizes 10,1000     (arguments go to bench.py)
+#   python cli.py demo                            (the original walkthrough, in memory only)
+# --metrics FILE writes the run's Prometheus metrics, --events prints its JSON events to stderr.
+
+
+def print_rows(rows):
+    for row in rows:
+        print(f"{row['ID']:>8}  {row['Title']} by {row['Author']} ({row['Status']})")
+
+
+def cmd_list(library, args):
+    if args.search:
+        rows = library.show_search_results(args.search, args.limit)
+    elif args.available:
+        rows = library.show_available_books((args.page - 1) * args.limit, args.limit)
+    else:
+        rows = library.show_books_page((args.page - 1) * args.limit, args.limit, args.sort)
+    print_rows(rows)
+    if not args.search:
+        total = library.count_available() if args.available else library.count_books()
+        print(f"Page {args.page}, {len(rows)} of {total} books.")
+    return 0
+
+
+def cmd_borrow(library, args):
+    try:
+        book = library.borrow_book(args.member_id, args.book_id)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Member {args.member_id} borrowed '{book.title}' ({library.open_loan(args.member_id, args.book_id)}).")
+    return 0
+
+
+def cmd_return(library, args):
+    try:
+        book = library.return_book(args.member_id, args.book_id)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Member {args.member_id} returned '{book.title}'.")
+    return 0
+
+
+def cmd_import(library, args):
+    fmt = args.format or detect_format(args.file)
+    with open(args.file, newline="", encoding="utf-8-sig") as stream:   # -sig: drops the BOM Excel writes to "CSV UTF-8"
+        added, problems = import_books(library, stream, fmt, args.batch_size)
+    for line_number, message in problems:
+        print(f"{args.file}:{line_number}: {message}", file=sys.stderr)
+    print(f"Imported {added} books, {len(problems)} rows rejected.")
+    return 1 if problems else 0
+
+
+def cmd_export(library, args):
+    fmt = args.format or detect_format(args.file)
+    with open(args.file, "w", newline="", encoding="utf-8") as stream:
+        written = export_books(library, stream, fmt, args.batch_size)
+    print(f"Exported {written} books to {args.file}.")
+    return 0
+
+
+def cmd_bench(args):
+    import bench                      # Only loaded when benchmarking
+    return bench.main(args.bench_args)
+
+
+def cmd_demo(args):                   # The walkthrough that used to run on import of entendimiento2.
+    library = Library()
+    book1 = Book("The Great Gatsby", "F. Scott Fitzgerald", 1)
+    book2 = Book("1984", "George Orwell", 2)
+    book3 = Book("Brave New World", "Aldous Huxley", 3)
+    member1 = Member("Alice", "secure123", 1001)
+    member2 = Member("Bob", "password456", 1002)
+    librarian1 = Librarian("Charlie", "admin123", 2001, library)
+
+    library.add_book(book1)
+    library.add_book(book2)
+    library.add_member(member1)
+    library.add_member(member2)
+    library.add_librarian(librarian1)
+    librarian1.add_book(book3)
+
+    print("Libros en la biblioteca")
+    print(library.show_books())
+    print("Libros en la biblioteca por el bibliotecario")
+    print(librarian1.view_books())
+    print("Miembros en la biblioteca")
+    print(library.show_members())
+    print("Miembros en la biblioteca por el bibliotecario")
+    print(librarian1.view_members())
+
+    library.borrow_book(member1.member_id, book1.book_id)
+    print(f"{member1.name} borrowed '{book1.title}'.")
+    print("Libros en la biblioteca despues de que un miembro toma prestado un libro")
+    print(library.show_books())
+    library.return_book(member1.member_id, book1.book_id)
+    print(f"{member1.name} returned '{book1.title}'.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Library catalog tools")
+    parser.add_argument("--db", default=os.environ.get("LIBRARY_DB", "library.db"), help="SQLite database file, or a journal directory (a directory or *.journal)")
+    parser.add_argument("--metrics", help="Write Prometheus metrics to this file when done")
+    parser.add_argument("--events", action="store_true", help="Log structured events (JSON lines) to stderr")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    command = subparsers.add_parser("list", help="Show one page of the catalog")
+    command.add_argument("--page", type=int, default=1)
+    command.add_argument("--limit", type=int, default=20)
+    command.add_argument("--sort", choices=Library.SORT_KEYS, default="book_id")
+    command.add_argument("--available", action="store_true", help="Only books that can be borrowed now")
+    command.add_argument("--search", help="Title/author search instead of the listing")
+    command.set_defaults(handler=cmd_list)
+
+    for name, handler, help_text in (("borrow", cmd_borrow, "Lend a book to a member"),
+                                     ("return", cmd_return, "Take a book back from a member")):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("member_id", type=int)
+        command.add_argument("book_id", type=int)
+        command.set_defaults(handler=handler)
+
+    for name, handler, help_text in (("import", cmd_import, "Load books from a CSV/JSONL file"),
+                                     ("export", cmd_export, "Write the catalog to a CSV/JSONL file")):
+        command = subparsers.add_parser(name, help=help_text)
+        command.add_argument("file")
+        command.add_argument("--format", choices=("csv", "jsonl"), help="Defaults to the file extension")
+        command.add_argument("--batch-size", type=int, default=1000)
+        command.set_defaults(handler=handler)
+
+    command = subparsers.add_parser("bench", help="Run bench.py (e.g. bench model --sizes 10,1000)")
+    command.add_argument("bench_args", nargs=argparse.REMAINDER)
+    command.set_defaults(standalone=cmd_bench)
+    command = subparsers.add_parser("demo", help="Run the original walkthrough on an in-memory library")
+    command.set_defaults(standalone=cmd_demo)
+
+    args = parser.parse_args(argv)
+    if args.events:
+        handler = logging.StreamHandler()
+        handler.setFormatter(EventFormatter())
+        EVENTS.addHandler(handler)
+        EVENTS.setLevel(logging.INFO)
+    if hasattr(args, "standalone"):   # Commands that don't open the database
+        return args.standalone(args)
+    storage = open_storage(args.db)
+    library = Library(storage)
+    try:
+        return args.handler(library, args)
+    finally:
+        storage.close()
+        if args.metrics:
+            library.metrics.write_prometheus(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,109 @@
+import hashlib
+import heapq
+import hmac
+import logging
+import math
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right, insort
+from collections import deque
+from contextlib import ExitStack, contextmanager, suppress
+from datetime import datetime
+
+from metrics import Metrics
+from ratelimit import RateLimiter
+from storage import MemoryStorage
+
+_WORD_RE = re.compile(r"\w+")
+
+# Structured events, one log record per library operation with its fields in
+# record.event. Silent unless the application configures a handler, e.g. with
+# metrics.EventFormatter for JSON lines.
+EVENTS = logging.getLogger("library.events")
+EVENTS.addHandler(logging.NullHandler())
+
+class LibraryError(ValueError):       # A refused operation; reason is the fixed label metrics count it under, never the message.
+    def __init__(self, message, reason="invalid"):
+        super().__init__(message)
+        self.reason = reason
+
+    def __reduce__(self):             # Keeps the reason when pickled (shard processes send errors back)
+        return type(self), (str(self), self.reason)
+
+
+class _Operation:                     # Times a block and records its event; a ValueError counts as a failure.
+    __slots__ = ("metrics", "series", "name", "fields", "start")   # A class, not a generator context manager: it runs on every borrow
+
+    def __init__(self, metrics, series, name, fields):
+        self.metrics = metrics
+        self.series = series          # The library's {(operation, outcome): (counter key, histogram key)}
+        self.name = name
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self.fields            # The block may add fields, or set fields["outcome"] for a non-error miss
+
+    def __exit__(self, kind, error, traceback):
+        if kind is None:
+            outcome = self.fields.pop("outcome", "ok")
+        elif issubclass(kind, ValueError):
+            outcome = failure_reason(error)
+        else:
+            return False
+        elapsed = time.perf_counter() - self.start
+        keys = self.series.get((self.name, outcome))
+        if keys is None:              # Label tuples built once per operation and outcome
+            keys = self.series[(self.name, outcome)] = (
+                Metrics.series("library_operations_total", operation=self.name, outcome=outcome),
+                Metrics.series("library_operation_seconds", operation=self.name))
+        self.metrics.record(keys[1], elapsed, counter=keys[0])
+        if EVENTS.isEnabledFor(logging.INFO):
+            EVENTS.info(self.name, extra={"event": dict(self.fields, outcome=outcome, seconds=elapsed)})
+        return False
+
+
+def failure_reason(error):            # Short, fixed label for a ValueError, so metrics never carry titles or names.
+    return getattr(error, "reason", "invalid")
+
+
+def fold(text):                      # Case- and accent-folds text so "García" and "garcia" compare equal.
+    if text.isascii():               # Fast path: nothing to strip
+        return text.lower()
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def normalize_name(text):            # Folded, whitespace-collapsed key for exact name lookups ("  García  Márquez" -> "garcia marquez").
+    return " ".join(fold(text).split())
+
+
+def tokenize(text):                  # Splits folded text into the words used by the search index (interned, shared).
+    return [sys.intern(token) for token in _WORD_RE.findall(fold(text))]
+
+
 class Book:
-    def __init__(self, title, author, book_id):
+    __slots__ = ("__title", "__author", "__book_id", "__copies", "__on_shelf", "__available", "__library")   # No per-book __dict__
+    MAX_COPIES = 1000                 # The copy bitmap is an int: each borrow/return costs O(copies), so keep it small
+
+    def __init__(self, title, author, book_id, copies=1):
+        if copies < 1:
+            raise ValueError("A book needs at least one copy.")
+        if copies > self.MAX_COPIES:
+            raise ValueError(f"A book can have at most {self.MAX_COPIES} copies.")
         self.__title = title        # Private attribute for book title
-        self.__author = author      # Private attribute for author name
+        self.__author = sys.intern(author)   # Private attribute for author name, shared by all their books
         self.__book_id = book_id    # Private attribute for unique book ID
-        self.__available = True     # Private attribute to track availability
-        
+        self.__copies = copies      # Number of physical copies
+        self.__on_shelf = (1 << copies) - 1   # Availability bitmap: bit i set while copy i+1 is on the shelf
+        self.__available = copies   # Copies on the shelf, so availability checks never count bits
+        self.__library = None       # Library holding the book, told whenever its copies are lent, returned or added
+
     @property
     def title(self):
         return self.__title
@@ -19,79 +118,1036 @@ class Book:
     
     @property
     def availability(self):
+        return self.__available > 0
+
+    @property
+    def copies(self):
+        return self.__copies
+
+    @property
+    def available_copies(self):
         return self.__available
-    
 
-    def borrow(self):                # Marks the book as unavailable if it’s currently available.
-        if self.__available:
-            self.__available = False
-            return True
-        return False
+    @property
+    def library(self):
+        return self.__library
+
+    @library.setter
+    def library(self, library):       # Set by Library.add_book()/remove_book().
+        self.__library = library
+    
 
-    def return_book(self):            # Marks the book as available and raises an error if already returned.
-        if self.__available:  
-            raise ValueError("Book is already returned.")
+    def borrow(self, copy=None):     # Lends a copy (the first on the shelf unless one is given); returns its number, or 0.
+        if copy is None:
+            if not self.__on_shelf:
+                return 0
+            index = (self.__on_shelf & -self.__on_shelf).bit_length() - 1    # Lowest set bit
         else:
-            self.__available = True  
+            index = copy - 1
+            if not 0 <= index < self.__copies or not self.__on_shelf >> index & 1:
+                return 0
+        self.__on_shelf &= ~(1 << index)
+        self.__available -= 1
+        self.__notify()
+        return index + 1
+
+    def return_book(self, copy=None):  # Puts a copy back on the shelf and raises an error if already returned.
+        on_loan = ~self.__on_shelf & ((1 << self.__copies) - 1)
+        index = (on_loan & -on_loan).bit_length() - 1 if copy is None else copy - 1
+        if not 0 <= index < self.__copies or not on_loan >> index & 1:
+            raise LibraryError("Book is already returned.", "not_borrowed")
+        self.__on_shelf |= 1 << index
+        self.__available += 1
+        self.__notify()
+
+    def add_copies(self, count):      # Adds new copies, all on the shelf.
+        if count < 1:
+            raise LibraryError("Number of copies must be positive.")
+        if self.__copies + count > self.MAX_COPIES:
+            raise LibraryError(f"A book can have at most {self.MAX_COPIES} copies.")
+        self.__on_shelf |= ((1 << count) - 1) << self.__copies
+        self.__copies += count
+        self.__available += count
+        self.__notify()
+
+    def __notify(self):               # Tells the library the copies or their availability just changed.
+        if self.__library is not None:
+            self.__library.book_changed(self)
+
+    def __status(self):
+        if self.__copies == 1:
+            return "Available" if self.__available else "Not Available"
+        return f"{self.__available} of {self.__copies} available"
 
     def __str__(self):                # Provides a user-friendly string representation of the book.
-        return f"(ID: {self.__book_id}) {self.__title} by {self.author}  - {'Available' if self.__available else 'Not Available'}"
+        return f"(ID: {self.__book_id}) {self.__title} by {self.author}  - {self.__status()}"
+
+    def as_row(self):                 # Table row used by the paged listing (one dict per visible book).
+        return {
+            "ID": self.__book_id,
+            "Title": self.__title,
+            "Author": self.__author,
+            "Copies": self.__copies,
+            "Status": self.__status(),
+        }
+
+
+SCRYPT_COST = 2 ** 14               # scrypt N; each doubling doubles login CPU time and memory
+SCRYPT_BLOCK_SIZE = 8
+SCRYPT_PARALLELISM = 1
+
+
+def _scrypt(password, salt, cost, block_size, parallelism):
+    maxmem = 128 * block_size * (cost + parallelism + 2) + 2 ** 20    # What scrypt needs, plus headroom
+    return hashlib.scrypt(password.encode(), salt=salt, n=cost, r=block_size, p=parallelism, maxmem=maxmem)
+
+
+def hash_password(password, cost=None):    # Salted scrypt hash stored as "scrypt$N$r$p$salt$digest".
+    cost = cost or SCRYPT_COST
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, cost, SCRYPT_BLOCK_SIZE, SCRYPT_PARALLELISM)
+    return f"scrypt${cost}${SCRYPT_BLOCK_SIZE}${SCRYPT_PARALLELISM}${salt.hex()}${digest.hex()}"
+
+
+def is_password_hash(value):
+    return isinstance(value, str) and value.startswith("scrypt$") and value.count("$") == 5
+
+
+def verify_password(password, stored):    # Recomputes the hash with the stored parameters; constant-time compare.
+    _, cost, block_size, parallelism, salt, digest = stored.split("$")
+    candidate = _scrypt(password, bytes.fromhex(salt), int(cost), int(block_size), int(parallelism))
+    return hmac.compare_digest(candidate, bytes.fromhex(digest))
+
+
+class SearchIndex:
+    TITLE_WEIGHT = 2                 # A word in the title ranks above the same word in the author
+    AUTHOR_WEIGHT = 1
+    EXACT_BONUS = 2                  # A whole-word match ranks above a prefix match
+    PROBE_TOKENS = 16                # Terms expanding to at most this many words are checked per candidate
+    MIN_PREFIX = 2                   # Shorter terms only match whole words ("a" would match half the catalog)
 
-class Library:
     def __init__(self):
+        self.__postings = {}         # Inverted index {token: {book_id: weight}}
+        self.__tokens = []           # Sorted vocabulary so every prefix is one bisect range
+        self.__lock = threading.Lock()   # Searches never see a batch half indexed
+
+    def add(self, book):             # Indexes the title and author words of a book.
+        self.add_many([book])
+
+    def add_many(self, books):       # Indexes a batch, re-sorting the vocabulary once rather than per new word.
+        author_tokens = {}           # Authors repeat across a batch: tokenise each one once
+        entries = []                 # (book_id, {token: weight}), tokenised before the lock is taken
+        for book in books:
+            author = book.author
+            weights = dict.fromkeys(tokenize(book.title), self.TITLE_WEIGHT)
+            if author not in author_tokens:
+                author_tokens[author] = set(tokenize(author))
+            for token in author_tokens[author]:
+                weights[token] = weights.get(token, 0) + self.AUTHOR_WEIGHT
+            entries.append((book.book_id, weights))
+        with self.__lock:
+            self.__insert(entries)
+
+    def __insert(self, entries):
+        new_tokens, postings = [], self.__postings
+        for book_id, weights in entries:
+            for token, weight in weights.items():
+                if token not in postings:
+                    postings[token] = {}
+                    new_tokens.append(token)
+                postings[token][book_id] = weight
+        if len(new_tokens) < 64:     # A few new words: insert in place instead of re-sorting the vocabulary
+            for token in new_tokens:
+                insort(self.__tokens, token)
+        else:
+            self.__tokens.extend(new_tokens)
+            self.__tokens.sort()
+
+    def remove(self, book):          # Drops a book from every posting list it appears in (re-tokenised, not stored).
+        tokens = set(tokenize(book.title)) | set(tokenize(book.author))
+        with self.__lock:
+            for token in tokens:
+                postings = self.__postings.get(token)
+                if postings is None or postings.pop(book.book_id, None) is None:
+                    continue
+                if not postings:
+                    del self.__postings[token]
+                    del self.__tokens[bisect_left(self.__tokens, token)]
+
+    def search(self, query, limit=20):    # Returns the best matching book IDs; every query word must match.
+        return [book_id for _, book_id in self.ranked(query, limit)]
+
+    def ranked(self, query, limit=20):    # (score, book_id) of the best matches, best first; a score only depends on the book and the query.
+        words = dict.fromkeys(tokenize(query))
+        with self.__lock:
+            return self.__ranked(words, limit)
+
+    def __ranked(self, words, limit):
+        terms = [(term, self.__expand(term)) for term in words]
+        if not terms:
+            return []
+        # Materialise the rarest term, then only check its candidates against the others.
+        terms.sort(key=lambda item: sum(len(self.__postings[token]) for token in item[1]))
+        scores = self.__match(*terms[0])
+        for term, tokens in terms[1:]:
+            if not scores:
+                return []
+            if len(tokens) <= self.PROBE_TOKENS:
+                scores = {book_id: score + best for book_id, score in scores.items()
+                          if (best := self.__probe(term, tokens, book_id))}
+            else:
+                matches = self.__match(term, tokens)
+                scores = {book_id: score + matches[book_id] for book_id, score in scores.items() if book_id in matches}
+        return [(scores[book_id], book_id) for book_id in heapq.nlargest(limit, scores, key=scores.__getitem__)]
+
+    def __expand(self, term):        # Indexed words starting with term: one slice of the sorted vocabulary.
+        if len(term) < self.MIN_PREFIX:
+            return [term] if term in self.__postings else []
+        tokens = self.__tokens
+        return tokens[bisect_left(tokens, term):bisect_left(tokens, term + "\U0010ffff")]
+
+    def __match(self, term, tokens):  # Scores every book holding one of the words term expands to.
+        matches = {}
+        for token in tokens:
+            bonus = self.EXACT_BONUS if token == term else 1
+            for book_id, weight in self.__postings[token].items():
+                if weight * bonus > matches.get(book_id, 0):
+                    matches[book_id] = weight * bonus
+        return matches
+
+    def __probe(self, term, tokens, book_id):   # Best score of one book for term, or 0.
+        best = 0
+        for token in tokens:
+            weight = self.__postings[token].get(book_id, 0) * (self.EXACT_BONUS if token == term else 1)
+            if weight > best:
+                best = weight
+        return best
+
+
+class RenderCache:
+    # Formatted books kept between calls. A title and author never change, so a
+    # book is only re-rendered after invalidate() reports a borrow, return, new
+    # copies or removal. The full listing is patched for the changed books only
+    # and handed out as one versioned snapshot shared by every caller.
+    MAX_ROWS = 100000                 # Cached rows; past this the cache starts over rather than mirror a huge catalog
+
+    def __init__(self, metrics):
+        self.__metrics = metrics
+        self.__rows = {}              # {book_id: as_row() dict}
+        self.__lines = {}             # {book_id: str(book)}, the listing being patched
+        self.__listing = None         # Snapshot returned by listing() until a book changes
+        self.__changed = set()        # Books changed since that snapshot
+        self.__version = 0
+        self.__epoch = 0              # Bumped by every invalidate(), so a row rendered meanwhile is not stored
+        self.__lock = threading.Lock()
+        metrics.describe("library_render_cache_total", "counter", "Rendered book rows and listings served from cache (hit) or re-rendered (miss).")
+
+    @property
+    def version(self):                # Version of the last listing() snapshot, bumped each time it is re-patched.
+        return self.__version
+
+    def invalidate(self, book_id):    # Drops a book's rendering after its state changed (or it was added/removed).
+        with self.__lock:
+            self.__epoch += 1
+            self.__rows.pop(book_id, None)
+            if self.__listing is not None:   # Before the first listing there is nothing to patch
+                self.__changed.add(book_id)
+
+    def invalidate_many(self, book_ids):   # invalidate() for a batch, taking the lock once.
+        with self.__lock:
+            self.__epoch += 1
+            for book_id in book_ids:
+                self.__rows.pop(book_id, None)
+                if self.__listing is not None:
+                    self.__changed.add(book_id)
+
+    def rows(self, books):            # as_row() for each book, rendering only the ones not cached.
+        rows, misses = [], 0
+        cached = self.__rows
+        for book in books:
+            row = cached.get(book.book_id)
+            if row is None:
+                epoch = self.__epoch
+                row = book.as_row()
+                misses += 1
+                with self.__lock:
+                    if epoch == self.__epoch:   # Not invalidated while rendering
+                        if len(cached) >= self.MAX_ROWS:
+                            cached.clear()
+                        cached[book.book_id] = row
+            rows.append(row)
+        self.__count("row", len(rows) - misses, misses)
+        return rows
+
+    def listing(self, books):         # {book_id: str(book)} for the catalog books, patched for the changed ones only.
+        with self.__lock:
+            if self.__listing is not None and not self.__changed:
+                self.__count("listing", 1, 0)
+                return self.__listing
+            if self.__listing is None:
+                self.__lines = {book_id: str(book) for book_id, book in books.items()}
+            else:
+                for book_id in self.__changed:
+                    book = books.get(book_id)
+                    if book is None:
+                        self.__lines.pop(book_id, None)
+                    else:
+                        self.__lines[book_id] = str(book)
+            self.__changed.clear()
+            self.__version += 1
+            self.__listing = dict(self.__lines)   # Callers keep their snapshot; later patches go to __lines
+            self.__count("listing", 0, 1)
+            return self.__listing
+
+    def __count(self, view, hits, misses):
+        if hits:
+            self.__metrics.inc("library_render_cache_total", hits, view=view, result="hit")
+        if misses:
+            self.__metrics.inc("library_render_cache_total", misses, view=view, result="miss")
+
+
+class Loan:
+    __slots__ = ("__loan_id", "__member_id", "__book_id", "__copy", "__borrowed_at", "__due_at", "__returned_at")
+
+    def __init__(self, loan_id, member_id, book_id, copy, borrowed_at, due_at, returned_at=None):
+        self.__loan_id = loan_id            # Unique, increasing loan number
+        self.__member_id = member_id
+        self.__book_id = book_id
+        self.__copy = copy                  # Physical copy lent
+        self.__borrowed_at = borrowed_at    # Timestamps are seconds since the epoch
+        self.__due_at = due_at
+        self.__returned_at = returned_at    # None while the loan is open
+
+    @property
+    def loan_id(self):
+        return self.__loan_id
+
+    @property
+    def member_id(self):
+        return self.__member_id
+
+    @property
+    def book_id(self):
+        return self.__book_id
+
+    @property
+    def copy(self):
+        return self.__copy
+
+    @property
+    def borrowed_at(self):
+        return self.__borrowed_at
+
+    @property
+    def due_at(self):
+        return self.__due_at
+
+    @property
+    def returned_at(self):
+        return self.__returned_at
+
+    def close(self, returned_at):     # Marks the loan as returned.
+        if self.__returned_at is not None:
+            raise ValueError("Loan is already closed.")
+        self.__returned_at = returned_at
+
+    def is_overdue(self, now):
+        return self.__returned_at is None and self.__due_at < now
+
+    def __str__(self):
+        return f"Loan {self.__loan_id}: book {self.__book_id} to member {self.__member_id}, due {datetime.fromtimestamp(self.__due_at):%Y-%m-%d}"
+
+
+class Library:
+    SORT_KEYS = ("book_id", "title", "author")    # Orders accepted by books_page()/show_books_page()
+    LOCK_STRIPES = 64                 # Loans on different books/members rarely share a lock
+    MAX_SESSIONS = 10000              # Logged-in sessions remembered; the oldest are dropped first
+    LOAN_DAYS = 14                    # Loan period before a book is overdue
+    MAX_HOLDS_PER_BOOK = 50           # Longest hold queue a single title accepts
+
+    def __init__(self, storage=None, metrics=None, login_limiter=None):
+        self.__storage = storage if storage is not None else MemoryStorage()   # Where every change is written through
+        self.__metrics = metrics if metrics is not None else Metrics()   # Operation counters/latencies, see metrics.py
+        self.__series = {}            # Metric keys per (operation, outcome), see _Operation
         self.__books = {}             # Dictionary to store books (key: book_id)
         self.__members = {}           # Dictionary to store members (key: member_id)
         self.__librarians = {}        # Dictionary to store librarians (key: employee_id)
+        self.__book_ids = []          # Book IDs kept sorted so a page is a slice, not a scan
+        self.__orderings = {}         # Cached title/author orderings, dropped when the catalog changes
+        self.__search_index = None    # Title/author index, built on first search, then kept in step with add/remove
+        self.__author_index = {}      # Books of each author {normalized author: sorted book IDs}
+        self.__name_index = {}        # Members by name {normalized name: sorted member IDs}
+        self.__available_ids = []     # IDs of books that can be borrowed right now, sorted so a page is a slice
+        self.__available_lock = threading.Lock()   # Borrows of different books update the list concurrently
+        self.__render_cache = RenderCache(self.__metrics)   # Formatted rows/listing, re-rendered per changed book only
+        self.__total_copies = 0       # Physical copies across the catalog
+        self.__catalog_lock = threading.RLock()   # Serialises catalog changes (add/remove book)
+        self.__member_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.__book_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.__sessions = {}          # Verified logins {token: (role, user_id)}, so the KDF runs once per login
+        self.__session_lock = threading.Lock()
+        self.__dummy_hash = None      # Checked for unknown IDs so they cost as much as a wrong password
+        self.__login_limiter = login_limiter if login_limiter is not None else RateLimiter()   # Login attempts per user ID and per client, see ratelimit.py
+        self.__loans = {}             # Loan ledger, open and closed {loan_id: Loan}
+        self.__open_loans = {}        # Open loan of each (member_id, book_id) {(member_id, book_id): loan_id}
+        self.__due_heap = []          # Min-heap of (due_at, loan_id); returned loans are dropped lazily
+        self.__stale_due = 0          # Heap entries whose loan is already closed
+        self.__next_loan_id = 1
+        self.__returns = []           # Loan IDs in the order they were closed, for incremental readers
+        self.__ledger_lock = threading.Lock()
+        self.__holds = {}             # FIFO hold queue per title {book_id: deque of member_id}
+        self.__member_holds = {}      # Titles each member is waiting for {member_id: {book_id: None}}
+        self.__holds_lock = threading.Lock()   # Keeps the queues and __member_holds in step for readers; taken last
+        self.__load()
+        self.__metrics.describe("library_operations_total", "counter", "Library operations by outcome (ok or failure reason).")
+        self.__metrics.describe("library_operation_seconds", "histogram", "Latency of library operations.")
+        for name, function, text in (("library_books", self.count_books, "Titles in the catalog."),
+                                     ("library_available_books", self.count_available, "Titles with a copy on the shelf."),
+                                     ("library_members", lambda: len(self.__members), "Registered members."),
+                                     ("library_open_loans", self.count_open_loans, "Loans not yet returned.")):
+            self.__metrics.describe(name, "gauge", text)
+            self.__metrics.gauge(name, function)
+
+    def __load(self):                 # Rebuilds the in-memory objects from the storage backend.
+        self.__index_books([Book(title, author, book_id, copies)
+                            for book_id, title, author, copies in self.__storage.load_books()])
+        for member_id, name, password in self.__storage.load_members():
+            member = Member(name, password, member_id, hashed=is_password_hash(password))
+            self.__members[member_id] = member
+            self.__name_index.setdefault(normalize_name(name), []).append(member_id)
+            if member.password != password:    # Plaintext row from before hashing: store the hash instead
+                self.__storage.update_password("Member", member_id, member.password)
+        for employee_id, name, password in self.__storage.load_librarians():
+            librarian = Librarian(name, password, employee_id, self, hashed=is_password_hash(password))
+            self.__librarians[employee_id] = librarian
+            if librarian.password != password:
+                self.__storage.update_password("Librarian", employee_id, librarian.password)
+        for record in self.__storage.load_loans():
+            loan = Loan(*record)
+            self.__loans[loan.loan_id] = loan
+            self.__next_loan_id = max(self.__next_loan_id, loan.loan_id + 1)
+            if loan.returned_at is not None:
+                self.__returns.append(loan.loan_id)
+            else:
+                book = self.__books[loan.book_id]
+                member = self.__members[loan.member_id]
+                member.borrowed_books[loan.book_id] = book
+                member.borrowed_copies[loan.book_id] = book.borrow(loan.copy)
+                self.__open_loans[(loan.member_id, loan.book_id)] = loan.loan_id
+                self.__due_heap.append((loan.due_at, loan.loan_id))
+        heapq.heapify(self.__due_heap)
+        for member_ids in self.__name_index.values():
+            member_ids.sort()
+        for member_id, book_id in self.__storage.load_holds():
+            self.__holds.setdefault(book_id, deque()).append(member_id)
+            self.__member_holds.setdefault(member_id, {})[book_id] = None
+
+    def __index_books(self, books):   # Adds books to every in-memory index; sorted structures are re-sorted once per batch.
+        if not books:
+            return
+        for book in books:
+            self.__books[book.book_id] = book
+            book.library = self
+            self.__total_copies += book.copies
+        with self.__available_lock:
+            if len(books) == 1:
+                if books[0].availability:
+                    insort(self.__available_ids, books[0].book_id)
+            else:
+                self.__available_ids.extend(book.book_id for book in books if book.availability)
+                self.__available_ids.sort()
+        self.__render_cache.invalidate_many(book.book_id for book in books)
+        if len(books) == 1:
+            insort(self.__book_ids, books[0].book_id)
+            insort(self.__author_index.setdefault(normalize_name(books[0].author), []), books[0].book_id)
+        else:
+            self.__book_ids.extend(book.book_id for book in books)
+            self.__book_ids.sort()
+            touched = {}              # {author as written: its list in the author index}
+            for book in books:
+                if book.author not in touched:
+                    touched[book.author] = self.__author_index.setdefault(normalize_name(book.author), [])
+                touched[book.author].append(book.book_id)
+            for book_ids in {id(ids): ids for ids in touched.values()}.values():   # Spellings can share a list
+                book_ids.sort()
+        self.__orderings.clear()
+        if self.__search_index is not None:
+            self.__search_index.add_many(books)
+
+    @property
+    def storage(self):
+        return self.__storage
+
+    @property
+    def metrics(self):
+        return self.__metrics
+
+    def __operation(self, operation, **fields):   # Context manager timing one operation, see _Operation.
+        return _Operation(self.__metrics, self.__series, operation, fields)
     
     def add_book(self, book):         # Validates and manages book additions.
         if not isinstance(book, Book):
-            raise ValueError("Invalid book.")
-        if book.book_id in self.__books:
-            print("This book is already in the library.")
-        else:
-            self.__books[book.book_id] = book
+            raise LibraryError("Invalid book.")
+        with self.__operation("add_book", book_id=book.book_id), self.__catalog_lock:
+            if book.book_id in self.__books:
+                raise LibraryError(f"A book with ID {book.book_id} already exists", "duplicate")
+            self.__storage.save_book(book.book_id, book.title, book.author, book.copies)
+            self.__index_books([book])
+
+    def add_books(self, books):       # Batch version of add_book(): one storage transaction, returns the duplicate IDs skipped.
+        new_books, duplicates, batch_ids = [], [], set()
+        with self.__operation("add_books") as event, self.__catalog_lock:
+            for book in books:
+                if not isinstance(book, Book):
+                    raise LibraryError("Invalid book.")
+                if book.book_id in self.__books or book.book_id in batch_ids:
+                    duplicates.append(book.book_id)
+                else:
+                    batch_ids.add(book.book_id)
+                    new_books.append(book)
+            self.__storage.save_books([(book.book_id, book.title, book.author, book.copies) for book in new_books])
+            self.__index_books(new_books)
+            event.update(added=len(new_books), duplicates=len(duplicates))
+        return duplicates
+
+    def add_copies(self, book_id, count, now=None):   # Adds physical copies to a title; the first holders get them.
+        now = time.time() if now is None else now
+        with self.__operation("add_copies", book_id=book_id, count=count):
+            with self.__catalog_lock:
+                while True:
+                    waiting = list(self.__holds.get(book_id, ()))[:count]
+                    with self.__loan_locks(waiting, book_id):
+                        if list(self.__holds.get(book_id, ()))[:count] != waiting:
+                            continue  # The queue changed before the locks were taken; look again
+                        book = self.__books.get(book_id)
+                        if book is None:
+                            raise LibraryError("Book not found", "book_not_found")
+                        book.add_copies(count)
+                        self.__total_copies += count
+                        self.__storage.update_copies(book_id, book.copies)
+                        for _ in waiting:
+                            self.__hand_over(book, now)
+                        break
+            if waiting:
+                self.__serve_holds(book_id, now)   # Copies left by holders at their limit go further down the queue
     
     def remove_book(self, book_id):   # Validates and manages book removals.
-        if book_id in self.__books:
+        with self.__operation("remove_book", book_id=book_id), \
+                self.__catalog_lock, self.__book_locks[hash(book_id) % self.LOCK_STRIPES]:
+            book = self.__books.get(book_id)
+            if book is None:
+                raise LibraryError("Book not found", "book_not_found")
+            if book.available_copies < book.copies:   # Open loans would outlive the book, and their copies with it
+                raise LibraryError(f"'{book.title}' has copies on loan; they must be returned first.", "on_loan")
+            self.__storage.delete_book(book_id)
+            with self.__holds_lock:
+                for member_id in self.__holds.pop(book_id, ()):
+                    self.__member_holds[member_id].pop(book_id, None)
+                    if not self.__member_holds[member_id]:
+                        del self.__member_holds[member_id]
             del self.__books[book_id]
-        else:
-            print("Book not found in the library.")
+            book.library = None
+            self.__total_copies -= book.copies
+            self.__set_available(book_id, False)
+            del self.__book_ids[bisect_left(self.__book_ids, book_id)]
+            self.__unindex(self.__author_index, normalize_name(book.author), book_id)
+            self.__orderings.clear()
+            self.__render_cache.invalidate(book_id)
+            if self.__search_index is not None:
+                self.__search_index.remove(book)
     
-    def show_books(self):             # Returns formatted lists of books.
-        return {book_id: str(book) for book_id, book in self.__books.items()}
+    def show_books(self):             # Returns formatted lists of books (a shared snapshot: do not modify it).
+        with self.__catalog_lock:     # No book added or removed while the listing is patched
+            return self.__render_cache.listing(self.__books)
+
+    @property
+    def render_cache(self):
+        return self.__render_cache
+
+    def count_books(self):
+        return len(self.__books)
+
+    def has_book(self, book_id):
+        return book_id in self.__books
+
+    def count_copies(self):
+        return self.__total_copies
+
+    def get_book(self, book_id):
+        return self.__books.get(book_id)
+
+    def get_member(self, member_id):
+        return self.__members.get(member_id)
+
+    def get_librarian(self, employee_id):
+        return self.__librarians.get(employee_id)
+
+    def books_page(self, offset=0, limit=20, sort_by="book_id", after_id=None):   # Returns one page of Book objects.
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"Cannot sort books by '{sort_by}'.")
+        if sort_by != "book_id" and after_id is not None:
+            raise ValueError("after_id paging is only supported when sorting by book_id.")
+        with self.__catalog_lock:     # The slice never sees a batch half added, nor a list mid-sort
+            if sort_by == "book_id":
+                ids = self.__book_ids
+                if after_id is not None:  # Keyset paging: continue right after the last ID already shown.
+                    offset = bisect_right(ids, after_id)
+            else:
+                ids = self.__ordering(sort_by)
+            ids = ids[offset:offset + limit]
+        books = self.__books
+        return [book for book in map(books.get, ids) if book is not None]   # Skips a book removed meanwhile
+
+    def show_books_page(self, offset=0, limit=20, sort_by="book_id", after_id=None):   # Formats only the visible page.
+        return self.__render_cache.rows(self.books_page(offset, limit, sort_by, after_id))
+
+    def page_keys(self, offset=0, limit=20, sort_by="book_id"):   # Sort keys of a page, for merging the pages of several libraries:
+        if sort_by == "book_id":                                     # book IDs, or (folded title/author, book ID) pairs.
+            with self.__catalog_lock:
+                return self.__book_ids[offset:offset + limit]
+        if sort_by not in self.SORT_KEYS:
+            raise ValueError(f"Cannot sort books by '{sort_by}'.")
+        with self.__catalog_lock:
+            ids = self.__ordering(sort_by)
+            keys = self.__orderings.get((sort_by, "keys"))
+            if keys is None:          # Folded once per catalog change, like the ordering itself
+                books = self.__books
+                keys = self.__orderings[(sort_by, "keys")] = [getattr(books[book_id], sort_by).casefold() for book_id in ids]
+            return list(zip(keys[offset:offset + limit], ids[offset:offset + limit]))
+
+    def show_books_by_id(self, book_ids):   # Rows of the given books, in that order; IDs no longer in the catalog are skipped.
+        books = self.__books
+        return self.__render_cache.rows([book for book in map(books.get, book_ids) if book is not None])
+
+    def book_changed(self, book):     # Called by Book.borrow()/return_book()/add_copies() to keep the availability list and renderings current.
+        self.__set_available(book.book_id, book.availability)
+        self.__render_cache.invalidate(book.book_id)
+
+    def __set_available(self, book_id, available):
+        with self.__available_lock:
+            ids = self.__available_ids
+            i = bisect_left(ids, book_id)
+            listed = i < len(ids) and ids[i] == book_id
+            if available and not listed:
+                ids.insert(i, book_id)
+            elif listed and not available:
+                del ids[i]
+
+    def count_available(self):
+        return len(self.__available_ids)
+
+    def available_books(self, offset=0, limit=20):   # Page of borrowable books by ID: a slice of the sorted list.
+        with self.__available_lock:
+            ids = self.__available_ids[offset:offset + limit]
+        books = self.__books
+        return [book for book in map(books.get, ids) if book is not None]   # Skips a book removed meanwhile
+
+    def show_available_books(self, offset=0, limit=20):
+        return self.__render_cache.rows(self.available_books(offset, limit))
+
+    def search_books(self, query, limit=20):   # Ranked title/author search backed by the inverted index.
+        with self.__operation("search", query=query) as event:
+            catalog = self.__books
+            books = [book for book in map(catalog.get, self.build_search_index().search(query, limit)) if book is not None]
+            event["results"] = len(books)
+        return books
+
+    def build_search_index(self):     # Returns the search index, indexing the whole catalog the first time.
+        index = self.__search_index
+        if index is None:             # Not built at load: most of a restart would go into tokenising every title
+            with self.__catalog_lock:
+                if self.__search_index is None:
+                    index = SearchIndex()
+                    index.add_many(list(self.__books.values()))
+                    self.__search_index = index
+                index = self.__search_index
+        return index
+
+    def show_search_results(self, query, limit=20):   # Formats the search hits as table rows.
+        return self.__render_cache.rows(self.search_books(query, limit))
+
+    def show_ranked_results(self, query, limit=20):   # (score, row) per search hit, for merging hits from several libraries.
+        with self.__operation("search", query=query) as event:
+            ranked = self.build_search_index().ranked(query, limit)
+            event["results"] = len(ranked)
+        books = self.__books
+        ranked = [(score, book) for score, book in ((score, books.get(book_id)) for score, book_id in ranked)
+                  if book is not None]   # Skips a book removed meanwhile
+        rows = self.__render_cache.rows([book for _, book in ranked])
+        return [(score, row) for (score, _), row in zip(ranked, rows)]
+
+    def books_by_author(self, author, offset=0, limit=20):   # Page of an author's books by ID, from the author index.
+        with self.__catalog_lock:     # Batches re-sort the index lists in place
+            ids = self.__author_index.get(normalize_name(author), [])[offset:offset + limit]
+        books = self.__books
+        return [book for book in map(books.get, ids) if book is not None]   # Skips a book removed meanwhile
+
+    def count_books_by_author(self, author):
+        return len(self.__author_index.get(normalize_name(author), ()))
+
+    def show_books_by_author(self, author, offset=0, limit=20):
+        return self.__render_cache.rows(self.books_by_author(author, offset, limit))
+
+    def find_members(self, name):     # Members whose name matches, ignoring case, accents and spacing.
+        members = self.__members
+        ids = list(self.__name_index.get(normalize_name(name), ()))   # Copied: registrations insert into it meanwhile
+        return [member for member in map(members.get, ids) if member is not None]   # Skips a member removed meanwhile
+
+    def show_found_members(self, name):
+        return [{"ID": member.member_id, "Name": member.name} for member in self.find_members(name)]
+
+    @staticmethod
+    def __unindex(index, key, value):   # Drops value from index[key]'s sorted list, and the key once it is empty.
+        values = index[key]
+        del values[bisect_left(values, value)]
+        if not values:
+            del index[key]
+
+    def __ordering(self, sort_by):    # Sorted book IDs for title/author, computed once per catalog change; caller holds __catalog_lock.
+        ordering = self.__orderings.get(sort_by)
+        if ordering is None:
+            books = self.__books
+            ordering = self.__orderings[sort_by] = sorted(
+                self.__book_ids, key=lambda book_id: getattr(books[book_id], sort_by).casefold()
+            )
+        return ordering
     
     def show_members(self):           # Returns formatted lists of members.
         return {member_id: member.name for member_id, member in self.__members.items()}
     
     def add_member(self, member):     # Handles member registration.
         if isinstance(member, Member):
-            if member.member_id in self.__members:
-                print("This member is already registered.")
-            else:
-                self.__members[member.member_id] = member
+            with self.__operation("add_member", member_id=member.member_id) as event:
+                if member.member_id in self.__members:
+                    event["outcome"] = "duplicate"
+                else:
+                    self.__storage.save_member(member.member_id, member.name, member.password)
+                    self.__members[member.member_id] = member
+                    insort(self.__name_index.setdefault(normalize_name(member.name), []), member.member_id)
                 
     def remove_member(self, member_id): # Handles member registration/deregistration.
-        if member_id in self.__members:
-            del self.__members[member_id]
-        else:
-            print("Member not found in the library.")
+        with self.__operation("remove_member", member_id=member_id) as event, \
+                self.__member_locks[hash(member_id) % self.LOCK_STRIPES]:
+            if member_id in self.__members:
+                if self.__members[member_id].borrowed_books:   # Their copies would stay off the shelf for good
+                    raise LibraryError(f"{self.__members[member_id].name} has books on loan; they must be returned first.", "on_loan")
+                self.__storage.delete_member(member_id)
+                with self.__holds_lock:
+                    for book_id in self.__member_holds.pop(member_id, ()):
+                        self.__holds[book_id].remove(member_id)
+                        if not self.__holds[book_id]:
+                            del self.__holds[book_id]
+                member = self.__members.pop(member_id)
+                self.__unindex(self.__name_index, normalize_name(member.name), member_id)
+            else:
+                event["outcome"] = "member_not_found"
             
     def add_librarian(self, librarian):    # # Handles librarian registration
         if isinstance(librarian, Librarian):
-            if librarian.employee_id in self.__librarians:
-                print("This librarian is already registered.")
+            with self.__operation("add_librarian", employee_id=librarian.employee_id) as event:
+                if librarian.employee_id in self.__librarians:
+                    event["outcome"] = "duplicate"
+                else:
+                    self.__storage.save_librarian(librarian.employee_id, librarian.name, librarian.password)
+                    self.__librarians[librarian.employee_id] = librarian
+
+    def borrow_book(self, member_id, book_id, now=None):    # Lends a book through Member.borrow_book() and records the loan.
+        now = time.time() if now is None else now
+        with self.__operation("borrow", member_id=member_id, book_id=book_id), self.__loan_locks([member_id], book_id):
+            member, book = self.__loan_parties(member_id, book_id)
+            self.__lend(member, book, now)
+            return book
+
+    def return_book(self, member_id, book_id, now=None):    # Takes a book back and hands it to the first holder, if any.
+        now = time.time() if now is None else now
+        with self.__operation("return", member_id=member_id, book_id=book_id):
+            return self.__take_back(member_id, book_id, now)
+
+    def __take_back(self, member_id, book_id, now):
+        while True:
+            queue = self.__holds.get(book_id)
+            holder_id = queue[0] if queue else None
+            with self.__loan_locks([member_id, holder_id], book_id):
+                queue = self.__holds.get(book_id)
+                if (queue[0] if queue else None) != holder_id:
+                    continue          # The queue changed before the locks were taken; look again
+                member, book = self.__loan_parties(member_id, book_id)
+                if book_id not in member.borrowed_books:
+                    raise LibraryError("You didn't borrow this book", "not_borrowed")
+                member.return_book(book)
+                with self.__ledger_lock:
+                    loan_id = self.__open_loans.pop((member_id, book_id), None)
+                    if loan_id is not None:
+                        self.__loans[loan_id].close(now)
+                        self.__storage.close_loan(loan_id, now)
+                        self.__returns.append(loan_id)
+                        self.__stale_due += 1
+                        self.__prune_due_heap()
+                if holder_id is not None:
+                    self.__hand_over(book, now)
+            if holder_id is not None and book.availability:
+                self.__serve_holds(book_id, now)   # The first holder was at the limit; the next ones get their turn
+            return book
+
+    def __lend(self, member, book, now):   # Lends a copy and records it in the ledger; caller holds the locks.
+        member.borrow_book(book)
+        with self.__ledger_lock:
+            loan = Loan(self.__next_loan_id, member.member_id, book.book_id, member.borrowed_copies[book.book_id],
+                        now, now + self.LOAN_DAYS * 86400)
+            self.__next_loan_id += 1
+            self.__storage.save_loan(loan.loan_id, loan.member_id, loan.book_id, loan.copy, loan.borrowed_at, loan.due_at)
+            self.__loans[loan.loan_id] = loan
+            self.__open_loans[(loan.member_id, loan.book_id)] = loan.loan_id
+            heapq.heappush(self.__due_heap, (loan.due_at, loan.loan_id))
+
+    def __hand_over(self, book, now):  # Lends a copy to the first holder; caller holds their lock and the book's.
+        holder_id = self.__holds[book.book_id][0]
+        self.__forget_hold(holder_id, book.book_id)
+        with suppress(ValueError), self.__operation("hand_over", member_id=holder_id, book_id=book.book_id):
+            self.__lend(self.__members[holder_id], book, now)   # At the borrowing limit: the hold lapses, the copy stays
+
+    def __serve_holds(self, book_id, now):   # Hands shelved copies to holders in queue order until none is left or nobody waits.
+        while True:
+            queue = self.__holds.get(book_id)
+            if not queue:
+                return
+            holder_id = queue[0]
+            with self.__loan_locks([holder_id], book_id):
+                queue = self.__holds.get(book_id)
+                if not queue or queue[0] != holder_id:
+                    continue          # The queue changed before the locks were taken; look again
+                book = self.__books.get(book_id)
+                if book is None or not book.availability:
+                    return
+                self.__hand_over(book, now)   # Lends or lets the hold lapse: either way the queue shrinks
+
+    def __forget_hold(self, member_id, book_id):   # Drops a hold; caller holds the member's and the book's stripe locks.
+        with self.__holds_lock:       # Off the member's holds first, then out of the queue
+            holds = self.__member_holds[member_id]
+            del holds[book_id]
+            if not holds:
+                del self.__member_holds[member_id]
+            queue = self.__holds[book_id]
+            if queue[0] == member_id:
+                queue.popleft()
             else:
-                self.__librarians[librarian.employee_id] = librarian
+                queue.remove(member_id)
+            if not queue:
+                del self.__holds[book_id]
+        self.__storage.delete_hold(member_id, book_id)
+
+    def place_hold(self, member_id, book_id, now=None):   # Queues the member for the next returned copy of a title.
+        now = time.time() if now is None else now
+        with self.__operation("place_hold", member_id=member_id, book_id=book_id), self.__loan_locks([member_id], book_id):
+            member, book = self.__loan_parties(member_id, book_id)
+            if book.availability:
+                raise LibraryError(f"'{book.title}' is available, borrow it instead.", "available")
+            if book_id in member.borrowed_books:
+                raise LibraryError(f"You already have a copy of '{book.title}'.", "duplicate")
+            if book_id in self.__member_holds.get(member_id, ()):
+                raise LibraryError(f"You already have a hold on '{book.title}'.", "duplicate")
+            if len(self.__holds.get(book_id, ())) >= self.MAX_HOLDS_PER_BOOK:
+                raise LibraryError(f"The hold queue for '{book.title}' is full.", "queue_full")
+            self.__storage.save_hold(member_id, book_id, now)
+            with self.__holds_lock:
+                queue = self.__holds.setdefault(book_id, deque())
+                queue.append(member_id)
+                self.__member_holds.setdefault(member_id, {})[book_id] = None
+                return len(queue)
+
+    def cancel_hold(self, member_id, book_id):
+        with self.__operation("cancel_hold", member_id=member_id, book_id=book_id), self.__loan_locks([member_id], book_id):
+            if book_id not in self.__member_holds.get(member_id, ()):
+                raise LibraryError("You have no hold on this book", "no_hold")
+            self.__forget_hold(member_id, book_id)
+
+    def show_member_holds(self, member_id):   # The member's holds with their place in each queue.
+        with self.__holds_lock:       # A consistent snapshot: hand-overs on other threads change both structures
+            positions = [(book_id, queue.index(member_id) + 1) for book_id in self.__member_holds.get(member_id, ())
+                         if member_id in (queue := self.__holds.get(book_id, ()))]
+        books = self.__books
+        rows = []
+        for book_id, position in positions:
+            book = books.get(book_id)
+            if book is not None:      # Skips a book removed meanwhile
+                rows.append({"ID": book_id, "Title": book.title, "Position": position})
+        return rows
+
+    def __prune_due_heap(self):       # Drops closed loans from the top, and rebuilds once most entries are stale.
+        heap = self.__due_heap
+        while heap and self.__loans[heap[0][1]].returned_at is not None:
+            heapq.heappop(heap)
+            self.__stale_due -= 1
+        if self.__stale_due > len(heap) // 2:
+            self.__due_heap = [(due_at, loan_id) for due_at, loan_id in heap if self.__loans[loan_id].returned_at is None]
+            heapq.heapify(self.__due_heap)
+            self.__stale_due = 0
+
+    def get_loan(self, loan_id):
+        return self.__loans.get(loan_id)
+
+    def open_loan(self, member_id, book_id):
+        loan_id = self.__open_loans.get((member_id, book_id))
+        return None if loan_id is None else self.__loans[loan_id]
+
+    def count_open_loans(self):
+        return len(self.__open_loans)
+
+    def loans_after(self, loan_id):   # Ledger entries numbered above loan_id, oldest first; O(new loans), for incremental readers.
+        with self.__ledger_lock:
+            last = self.__next_loan_id
+        return [loan for loan in map(self.__loans.get, range(loan_id + 1, last)) if loan is not None]
+
+    def returns_after(self, position):   # (loans closed since the first `position` returns, new position); O(new returns).
+        with self.__ledger_lock:
+            loan_ids = self.__returns[position:]
+        return [self.__loans[loan_id] for loan_id in loan_ids], position + len(loan_ids)
+
+    def overdue_loans(self, now=None, limit=None):   # Open loans past due, most overdue first; O(k log n) for k results.
+        now = time.time() if now is None else now
+        with self.__ledger_lock:
+            heap = self.__due_heap
+            overdue = []
+            frontier = [(heap[0][0], 0)] if heap else []    # Walks the heap as a tree, visiting only overdue nodes
+            while frontier and (limit is None or len(overdue) < limit):
+                due_at, i = heapq.heappop(frontier)
+                if due_at >= now:
+                    break
+                loan = self.__loans[heap[i][1]]
+                if loan.returned_at is None:
+                    overdue.append(loan)
+                for child in (2 * i + 1, 2 * i + 2):
+                    if child < len(heap):
+                        heapq.heappush(frontier, (heap[child][0], child))
+            return overdue
+
+    def show_overdue_loans(self, now=None, limit=None):   # Formats overdue loans as table rows.
+        now = time.time() if now is None else now
+        rows = []
+        for loan in self.overdue_loans(now, limit):
+            book = self.__books.get(loan.book_id)
+            member = self.__members.get(loan.member_id)
+            rows.append({
+                "Loan": loan.loan_id,
+                "Member": str(member) if member else f"(removed) ID: {loan.member_id}",
+                "Book": f"(ID: {loan.book_id}) {book.title}" if book else f"(removed) ID: {loan.book_id}",
+                "Copy": loan.copy,
+                "Due": f"{datetime.fromtimestamp(loan.due_at):%Y-%m-%d}",
+                "Days Overdue": int((now - loan.due_at) // 86400),
+            })
+        return rows
+
+    def member_usage(self, member_id):   # (open loans, holds) of a member, e.g. to apply BORROW_LIMIT across libraries.
+        member = self.__members.get(member_id)
+        if member is None:
+            raise LibraryError("Member not found", "member_not_found")
+        return len(member.borrowed_books), len(self.__member_holds.get(member_id, ()))
+
+    def show_member_loans(self, member_id):   # The member's open loans with their due dates.
+        member = self.__members.get(member_id)
+        if member is None:
+            return []
+        with self.__member_locks[hash(member_id) % self.LOCK_STRIPES]:   # Borrows and hand-overs change the dicts under it
+            loans = [(book_id, book, member.borrowed_copies.get(book_id)) for book_id, book in member.borrowed_books.items()]
+        rows = []
+        for book_id, book, copy in loans:
+            loan = self.open_loan(member_id, book_id)   # None if returned since the copy was taken
+            rows.append({
+                "ID": book_id,
+                "Title": book.title,
+                "Copy": copy,
+                "Due": f"{datetime.fromtimestamp(loan.due_at):%Y-%m-%d}" if loan else "",
+            })
+        return rows
+
+    @contextmanager
+    def __loan_locks(self, member_ids, book_id):   # Member stripes in ascending order, then the book stripe, so lock order never cycles.
+        stripes = sorted({hash(member_id) % self.LOCK_STRIPES for member_id in member_ids if member_id is not None})
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self.__member_locks[stripe])
+            stack.enter_context(self.__book_locks[hash(book_id) % self.LOCK_STRIPES])
+            yield
+
+    def __loan_parties(self, member_id, book_id):
+        member = self.__members.get(member_id)
+        if member is None:
+            raise LibraryError("Member not found", "member_not_found")
+        book = self.__books.get(book_id)
+        if book is None:
+            raise LibraryError("Book not found", "book_not_found")
+        return member, book
+
+    def authenticate(self, role, user_id, password, client=None, now=None):   # Verifies a login and returns a session token, or None.
+        with self.__operation("authenticate", role=role, user_id=user_id) as event:
+            self.__throttle_login(role, user_id, client, now)
+            token = self.__verify_login(role, user_id, password)
+            if token is None:
+                event["outcome"] = "rejected"
+            else:                     # Proven owner: a few typos before this do not count against the next login
+                self.__login_limiter.reset((role, user_id))
+                if client is not None:
+                    self.__login_limiter.reset(("client", client))
+            return token
+
+    def __throttle_login(self, role, user_id, client, now):   # Raises before the KDF runs if the ID or the client is locked out.
+        keys = [("client", client)] if client is not None else []
+        for key in keys + [(role, user_id)]:   # The client first: one session hammering many IDs stops there
+            wait = self.__login_limiter.acquire(key, now)
+            if wait:
+                raise LibraryError(f"Too many login attempts. Try again in {math.ceil(wait)} seconds.", "rate_limited")
+
+    @property
+    def login_limiter(self):
+        return self.__login_limiter
+
+    def __verify_login(self, role, user_id, password):
+        users = self.__members if role == "Member" else self.__librarians
+        user = users.get(user_id)
+        if user is None:
+            if self.__dummy_hash is None:
+                self.__dummy_hash = hash_password(secrets.token_hex(8))
+            verify_password(password, self.__dummy_hash)
+            return None
+        if not user.check_password(password):
+            return None
+        token = secrets.token_urlsafe(32)
+        with self.__session_lock:
+            self.__sessions[token] = (role, user_id)
+            while len(self.__sessions) > self.MAX_SESSIONS:
+                del self.__sessions[next(iter(self.__sessions))]
+        return token
+
+    def session_user(self, token):    # The Member/Librarian behind a session token, without re-running the KDF.
+        session = self.__sessions.get(token)
+        if session is None:
+            return None
+        role, user_id = session
+        return self.__members.get(user_id) if role == "Member" else self.__librarians.get(user_id)
+
+    def end_session(self, token):
+        with self.__session_lock:
+            self.__sessions.pop(token, None)
+
+    def change_password(self, user, new_password):    # Updates a member's or librarian's password and persists it.
+        role, user_id = ("Member", user.member_id) if isinstance(user, Member) else ("Librarian", user.employee_id)
+        with self.__operation("change_password", role=role, user_id=user_id):
+            if len(new_password) < 6:
+                raise LibraryError("Password must be at least 6 characters", "invalid_password")
+            user.password = new_password
+            self.__storage.update_password(role, user_id, user.password)
 
 
 class Member:
+    __slots__ = ("__name", "__password", "__member_id", "__borrowed_books", "__borrowed_copies")
     BORROW_LIMIT = 3     # Class-level constant for max books a member can borrow
 
-    def __init__(self, name, password, member_id):
+    def __init__(self, name, password, member_id, hashed=False):
         self.__name = name            # Member's name.
-        self.__password = password    # Password (validated via setter).
+        self.__password = password if hashed else hash_password(password)   # Salted hash, never the plaintext.
         self.__member_id = member_id    # Unique Member ID.
         self.__borrowed_books = {}    # Dictionary to track borrowed books {book_id: Book}.
+        self.__borrowed_copies = {}   # Copy number held of each borrowed title {book_id: copy}.
         
     @property
     def name(self):
@@ -108,41 +1164,51 @@ class Member:
     @property
     def borrowed_books(self):
         return self.__borrowed_books
+
+    @property
+    def borrowed_copies(self):
+        return self.__borrowed_copies
     
     @password.setter
     def password(self, new_password):     # The password setter enforces a minimum length of 6 characters.
         if len(new_password) < 6:
-            print("Password must be at least 6 characters long.")
-        else:
-            self.__password = new_password
+            raise LibraryError("Password must be at least 6 characters long.", "invalid_password")
+        self.__password = hash_password(new_password)
+
+    def check_password(self, password):
+        return verify_password(password, self.__password)
             
 
-    def borrow_book(self, book):        # Checks if the member hasn’t exceeded BORROW_LIMIT and updates
+    def borrow_book(self, book, copy=None):   # Checks if the member hasn’t exceeded BORROW_LIMIT and updates
         if len(self.__borrowed_books) >= self.BORROW_LIMIT:
-            raise ValueError(f"{self.__name} has reached the borrowing limit!")
+            raise LibraryError(f"{self.__name} has reached the borrowing limit!", "limit_reached")
+        if book.book_id in self.__borrowed_books:
+            raise LibraryError(f"{self.__name} already has a copy of '{book.title}'.", "duplicate")
         
-        if book.borrow():
+        copy = book.borrow(copy)
+        if copy:
             self.__borrowed_books[book.book_id] = book  
-            print(f"{self.__name} borrowed '{book.title}'.")
+            self.__borrowed_copies[book.book_id] = copy
             return True
-        raise ValueError(f"{book.title} is not available.")
+        raise LibraryError(f"{book.title} is not available.", "unavailable")
 
     def return_book(self, book):        # Validates returns and updates availability
         if book.book_id in self.__borrowed_books:
-            book.return_book()
+            book.return_book(self.__borrowed_copies.pop(book.book_id))
             del self.__borrowed_books[book.book_id]  
-            print(f"{self.__name} returned '{book.title}'.")
         else:
-            print("This book was not borrowed by this member.")
+            raise LibraryError("This book was not borrowed by this member.", "not_borrowed")
             
     def __str__(self):
         return f"{self.__name} (ID: {self.__member_id})"
 
 
 class Librarian:
-    def __init__(self, name, password, employee_id, library):
+    __slots__ = ("__name", "__password", "__employee_id", "__library")
+
+    def __init__(self, name, password, employee_id, library, hashed=False):
         self.__name = name        # Librarian's name.
-        self.__password = password        # Password (validated via setter).
+        self.__password = password if hashed else hash_password(password)        # Salted hash, never the plaintext.
         self.__employee_id = employee_id        # Unique employee ID.
         self.__library = library        # Reference to the Library instance for delegation.
 
@@ -161,17 +1227,17 @@ class Librarian:
     @password.setter
     def password(self, new_password):
         if len(new_password) < 6:
-            print("Password must be at least 6 characters long.")
-        else:
-            self.__password = new_password
+            raise LibraryError("Password must be at least 6 characters long.", "invalid_password")
+        self.__password = hash_password(new_password)
 
-    def add_book(self, book):    # Delegates to Library.add_book() and prints confirmation.
+    def check_password(self, password):
+        return verify_password(password, self.__password)
+
+    def add_book(self, book):    # Delegates to Library.add_book(), which records the event.
         self.__library.add_book(book)
-        print(f"Book '{book.title}' added to the library.")
 
-    def remove_book(self, book_id):    # Delegates to Library.remove_book() and prints confirmation.
+    def remove_book(self, book_id):    # Delegates to Library.remove_book(), which records the event.
         self.__library.remove_book(book_id)
-        print(f"Book with ID {book_id} removed from the library.")
 
     def view_books(self):        # Displays all books in the library via Library.show_books().
         books = self.__library.show_books()
@@ -190,62 +1256,3 @@ class Librarian:
             
     def __str__(self): # String representation (e.g., 'Charlie (ID: 2001)').
         return f"{self.__name} (ID: {self.__employee_id})"
-            
-            
-            
-
-
-
-# Create library instances
-library = Library()
-
-# Create books
-book1 = Book("The Great Gatsby", "F. Scott Fitzgerald", 1)
-book2 = Book("1984", "George Orwell", 2)
-book3 = Book("Brave New World", "Aldous Huxley", 3)
-
-# Create members
-member1 = Member("Alice", "secure123", 1001)
-member2 = Member("Bob", "password456", 1002)
-
-# Create librarian
-librarian1 = Librarian("Charlie", "admin123", 2001, library)
-
-# Add books to the library
-library.add_book(book1)
-library.add_book(book2)
-
-# Add members to the library
-library.add_member(member1)
-library.add_member(member2)
-
-# Add librarian to the library
-library.add_librarian(librarian1)
-
-# Librarian adds a book
-librarian1.add_book(book3)
-
-# show books
-
-print ("Libros en la biblioteca")
-print (library.show_books())
-
-print ("Libros en la biblioteca por el bibliotecario")
-print (librarian1.view_books())
-
-print ("Miembros en la biblioteca")
-print (library.show_members())
-
-print ("Miembros en la biblioteca por el bibliotecario")
-print (librarian1.view_members())
-
-# Member borrows a book
-member1.borrow_book(book1)
-
-
-print ("Libros en la biblioteca despues de que un miembro toma prestado un libro")
-print (library.show_books())
-
-# Member returns a book
-member1.return_book(book1)
-
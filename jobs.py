@@ -0,0 +1,130 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+
+# Background jobs for long librarian operations (imports, exports, reports), so
+# the Streamlit script thread only submits work and then polls its status.
+# Threads rather than processes: every job works on the shared in-memory Library.
+#
+#   job_id = runner.submit("Import books.csv", import_job, stream)
+#   runner.get(job_id).status / .progress / .message / .result
+#   runner.cancel(job_id)
+#
+# A job function takes the Job as its first argument. Job.report() updates the
+# progress and is also the cancellation point: it raises JobCancelled once
+# cancel() was called, so a cancelled job stops at its next report.
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    __slots__ = ("job_id", "name", "status", "progress", "message", "result", "error",
+                 "submitted_at", "started_at", "finished_at", "_cancel", "_future")
+
+    def __init__(self, job_id, name):
+        self.job_id = job_id
+        self.name = name
+        self.status = QUEUED
+        self.progress = None          # Fraction done (0.0-1.0), or None while unknown
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._future = None
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED)
+
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def report(self, progress=None, message=None):   # Called by the job function; raises JobCancelled if cancelled.
+        if self._cancel.is_set():
+            raise JobCancelled()
+        if progress is not None:
+            self.progress = min(max(progress, 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def as_row(self):                 # Table row for the job list
+        elapsed = 0.0 if self.started_at is None else (self.finished_at or time.time()) - self.started_at
+        return {
+            "Job": self.job_id,
+            "Name": self.name,
+            "Status": self.status,
+            "Progress": "" if self.progress is None else f"{self.progress:.0%}",
+            "Message": self.error or self.message,
+            "Seconds": round(elapsed, 1),
+        }
+
+
+class JobRunner:
+    MAX_WORKERS = 2                   # Jobs running at once; the rest wait in the queue
+    MAX_FINISHED = 50                 # Finished jobs kept for the job table, the oldest dropped first
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.__pool = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self.__jobs = {}              # {job_id: Job}, in submission order
+        self.__ids = count(1)
+        self.__lock = threading.Lock()
+
+    def submit(self, name, function, *args, **kwargs):   # Queues function(job, *args, **kwargs); returns the job ID.
+        with self.__lock:
+            job = Job(next(self.__ids), name)
+            self.__jobs[job.job_id] = job
+            self.__trim()
+        job._future = self.__pool.submit(self.__run, job, function, args, kwargs)
+        return job.job_id
+
+    def __run(self, job, function, args, kwargs):
+        if job.cancel_requested:      # Cancelled while queued, after the pool had already picked it up
+            job.status, job.finished_at = CANCELLED, time.time()
+            return
+        job.status, job.started_at = RUNNING, time.time()
+        try:
+            job.result = function(job, *args, **kwargs)
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:        # Reported in the job table instead of killing the worker
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        else:
+            job.status, job.progress = DONE, 1.0
+        finally:
+            job.finished_at = time.time()
+
+    def __trim(self):                 # Caller holds the lock.
+        finished = [job_id for job_id, job in self.__jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.MAX_FINISHED)]:
+            del self.__jobs[job_id]
+
+    def get(self, job_id):
+        return self.__jobs.get(job_id)
+
+    def jobs(self):                   # Every job still remembered, newest first.
+        with self.__lock:
+            return list(reversed(self.__jobs.values()))
+
+    def cancel(self, job_id):         # Asks a job to stop; a queued job never starts. False if it already finished.
+        job = self.__jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job._cancel.set()
+        if job._future is not None and job._future.cancel():
+            job.status, job.finished_at = CANCELLED, time.time()
+        return True
+
+    def shutdown(self, wait=True):
+        for job in self.jobs():
+            self.cancel(job.job_id)
+        self.__pool.shutdown(wait=wait)
@@ -0,0 +1,134 @@
+import json
+import logging
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters, gauges and histograms, exported in the Prometheus text
+# format either to a file (for node_exporter's textfile collector) or from a
+# small HTTP endpoint:
+#   library.metrics.write_prometheus("library.prom")
+#   library.metrics.serve(9108)       # GET http://127.0.0.1:9108/metrics
+# Rates (operations per second) are left to Prometheus: rate() over a counter.
+
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)   # Seconds
+
+
+class Metrics:
+    def __init__(self, buckets=BUCKETS):
+        self.__buckets = tuple(sorted(buckets))
+        self.__lock = threading.Lock()
+        self.__help = {}              # {name: (type, help text)}
+        self.__counters = {}          # {(name, labels): value}
+        self.__histograms = {}        # {(name, labels): [count per bucket..., +Inf count, sum]}
+        self.__gauges = {}            # {name: function returning the current value}, sampled at export
+
+    def describe(self, name, kind, text):   # kind is "counter", "gauge" or "histogram"
+        self.__help[name] = (kind, text)
+
+    @staticmethod
+    def series(name, **labels):       # Key of one labelled series; hot paths build it once and pass it to add()/record().
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        self.add(self.series(name, **labels), value)
+
+    def observe(self, name, value, **labels):
+        self.record(self.series(name, **labels), value)
+
+    def add(self, key, value=1):      # inc() for a key from series()
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+
+    def record(self, key, value, counter=None):   # observe() for a key from series(); also adds 1 to the counter key, if given.
+        index = bisect_left(self.__buckets, value)    # First bucket whose upper bound holds value
+        with self.__lock:             # One acquisition for both: this runs once per library operation
+            counts = self.__histograms.get(key)
+            if counts is None:
+                counts = self.__histograms[key] = [0] * (len(self.__buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+            if counter is not None:
+                self.__counters[counter] = self.__counters.get(counter, 0) + 1
+
+    def gauge(self, name, function):
+        self.__gauges[name] = function
+
+    def value(self, name, **labels):  # Current value of a counter, or the observation count of a histogram.
+        key = (name, tuple(sorted(labels.items())))
+        with self.__lock:
+            if key in self.__histograms:
+                return sum(self.__histograms[key][:-1])
+            return self.__counters.get(key, 0)
+
+    def to_prometheus(self):          # Text exposition format, version 0.0.4.
+        with self.__lock:
+            counters = sorted(self.__counters.items())
+            histograms = sorted((key, list(counts)) for key, counts in self.__histograms.items())
+        lines, described = [], set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                text = self.__help.get(name, (kind, name))[1]
+                lines.append(f"# HELP {name} {text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+        for name, function in sorted(self.__gauges.items()):
+            header(name, "gauge")
+            lines.append(f"{name} {function()}")
+        for (name, labels), counts in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(self.__buckets + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {counts[-1]}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):   # Writes the snapshot atomically, so a scraper never reads half a file.
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as stream:
+            stream.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+    def serve(self, port, host="127.0.0.1"):   # Serves /metrics from a daemon thread; returns the server (call shutdown() to stop).
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):   # Scrapes are not worth a line on stderr each
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        return server
+
+
+def _labels(labels):                 # {key="value",...} with quotes, backslashes and newlines escaped.
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class EventFormatter(logging.Formatter):   # One JSON object per line for the library's structured events.
+    def format(self, record):
+        event = {"time": record.created, "event": record.getMessage()}
+        event.update(getattr(record, "event", {}))
+        return json.dumps(event, default=str)
@@ -0,0 +1,79 @@
+import threading
+import time
+
+# Token buckets for the login path. Each key (a user ID, a client session) gets
+# CAPACITY attempts that refill at one per REFILL_SECONDS. Emptying the bucket
+# locks the key out, for LOCKOUT seconds the first time and twice as long on
+# each lockout after that, up to MAX_LOCKOUT:
+#
+#   wait = limiter.acquire(("Member", 1001))   # 0.0: go ahead; otherwise seconds to wait
+#   limiter.reset(("Member", 1001))            # after a successful login
+#
+# A key costs one small bucket while it is active. Buckets are kept in order of
+# last use, so the ones idle for longer than a full refill and the longest
+# lockout are dropped from the front of the dict, a few per call.
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at", "strikes", "locked_until")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated_at = now
+        self.strikes = 0              # Lockouts so far; each one doubles the next
+        self.locked_until = 0.0
+
+
+class RateLimiter:
+    CAPACITY = 5                      # Attempts allowed in a burst
+    REFILL_SECONDS = 30.0             # One attempt regained per interval
+    LOCKOUT = 60.0                    # First lockout when the bucket runs dry
+    MAX_LOCKOUT = 3600.0
+    MAX_KEYS = 100000                 # Hard cap on buckets; the least recently used go first
+
+    def __init__(self, capacity=CAPACITY, refill_seconds=REFILL_SECONDS, lockout=LOCKOUT,
+                 max_lockout=MAX_LOCKOUT, max_keys=MAX_KEYS):
+        self.__capacity = capacity
+        self.__refill_seconds = refill_seconds
+        self.__lockout = lockout
+        self.__max_lockout = max_lockout
+        self.__max_keys = max_keys
+        self.__idle = max(capacity * refill_seconds, max_lockout)   # Idle this long, a bucket is full and unlocked again
+        self.__buckets = {}           # {key: _Bucket}, least recently used first
+        self.__lock = threading.Lock()
+
+    def acquire(self, key, now=None):   # Takes one attempt from key's bucket: 0.0 if allowed, else seconds until retry.
+        now = time.time() if now is None else now
+        with self.__lock:
+            self.__evict(now)
+            bucket = self.__buckets.pop(key, None)
+            if bucket is None:
+                bucket = _Bucket(self.__capacity, now)
+            self.__buckets[key] = bucket  # Re-inserted: now the most recently used
+            if bucket.locked_until > now:
+                return bucket.locked_until - now
+            bucket.tokens = min(self.__capacity, bucket.tokens + (now - bucket.updated_at) / self.__refill_seconds)
+            bucket.updated_at = now
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0.0
+            bucket.strikes += 1
+            bucket.locked_until = now + min(self.__lockout * 2 ** (bucket.strikes - 1), self.__max_lockout)
+            return bucket.locked_until - now
+
+    def reset(self, key):             # Forgets key, e.g. once its owner proved who they are.
+        with self.__lock:
+            self.__buckets.pop(key, None)
+
+    def __len__(self):
+        return len(self.__buckets)
+
+    def __evict(self, now):           # Caller holds the lock. Amortised O(1): each bucket is dropped once.
+        buckets = self.__buckets
+        while len(buckets) >= self.__max_keys:
+            del buckets[next(iter(buckets))]
+        for _ in range(2):            # A couple per call keeps up with the rate new keys arrive
+            key = next(iter(buckets), None)
+            if key is None or now - buckets[key].updated_at < self.__idle or buckets[key].locked_until > now:
+                break
+            del buckets[key]
@@ -0,0 +1,284 @@
+import heapq
+import multiprocessing
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from itertools import chain, islice
+
+from entendimiento2 import Book, Library, LibraryError, Member
+from storage import open_storage
+
+# A catalog split over several Library shards, each one a branch of the
+# consortium or a hash partition of the book IDs:
+#
+#   library = ShardedLibrary([ProcessShard("shard0.db"), ProcessShard("shard1.db")])
+#   library = ShardedLibrary({"north": ProcessShard("north.db"), "south": ProcessShard("south.db")},
+#                            placement="branch")
+#   library.add_book(Book("Dune", "Frank Herbert", 1), branch="north")
+#
+# The coordinator owns no catalog data. Book operations (add/remove, copies,
+# borrow/return, holds) go to the shard owning the book. Listings and searches
+# ask every shard in parallel for its part and merge the pages. Members are
+# replicated on every shard (each shard its own copy), so anyone can borrow
+# anywhere. The borrowing limit spans the shards: the coordinator counts a
+# member's loans and holds on every shard before a borrow or a hold goes
+# through. A hold reserves one of the member's BORROW_LIMIT slots, because the
+# shard that hands them the copy later does not ask the others.
+#
+# A shard is anything with call(method, *args, **kwargs): LocalShard wraps a
+# Library in this process, ProcessShard runs one in a child process. Results
+# cross the pipe as rows (dicts, tuples), never as Book or Member objects.
+
+SHARD_METHODS = frozenset((           # Library methods a shard answers
+    "add_book", "add_books", "add_copies", "remove_book", "has_book",
+    "add_member", "remove_member", "show_found_members", "member_usage",
+    "borrow_book", "return_book", "place_hold", "cancel_hold", "show_member_loans",
+    "show_books", "show_books_page", "page_keys", "show_books_by_id", "show_available_books", "show_ranked_results", "show_books_by_author",
+    "count_books", "count_copies", "count_available", "count_open_loans", "count_books_by_author",
+))
+
+ROW_ORDER = {                         # Merge key per Library sort order; ties go by ID, as within one Library
+    "book_id": lambda row: row["ID"],
+    "title": lambda row: (row["Title"].casefold(), row["ID"]),
+    "author": lambda row: (row["Author"].casefold(), row["ID"]),
+}
+
+
+def _portable(result):                # A Book (holding its Library) travels as its table row.
+    return result.as_row() if isinstance(result, Book) else result
+
+
+def _dispatch(library, method, args, kwargs):
+    if method not in SHARD_METHODS:
+        raise ValueError(f"'{method}' is not a shard method.")
+    return _portable(getattr(library, method)(*args, **kwargs))
+
+
+def _serve(connection, path):         # Child process: one Library, requests answered in order until None or EOF.
+    library = Library(open_storage(path) if path else None)
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:              # The coordinator went away
+            break
+        if request is None:
+            break
+        method, args, kwargs = request
+        try:
+            reply = ("ok", _dispatch(library, method, args, kwargs))
+        except Exception as e:        # Raised again in the coordinator
+            reply = ("error", e)
+        connection.send(reply)
+    library.storage.close()
+
+
+class LocalShard:
+    def __init__(self, library=None):
+        self.__library = library if library is not None else Library()
+
+    @property
+    def library(self):
+        return self.__library
+
+    def call(self, method, *args, **kwargs):
+        return _dispatch(self.__library, method, args, kwargs)
+
+    def close(self):
+        self.__library.storage.close()
+
+
+class ProcessShard:
+    def __init__(self, path=None):    # path: the shard's own database (see open_storage); None keeps it in memory.
+        context = multiprocessing.get_context("spawn")   # Never forks the coordinator's threads
+        self.__connection, child = context.Pipe()
+        self.__process = context.Process(target=_serve, args=(child, path), daemon=True)
+        self.__process.start()
+        child.close()
+        self.__lock = threading.Lock()   # One request in flight per pipe
+
+    def call(self, method, *args, **kwargs):
+        with self.__lock:
+            self.__connection.send((method, args, kwargs))
+            status, value = self.__connection.recv()
+        if status == "error":
+            raise value
+        return value
+
+    def close(self):
+        with self.__lock:
+            with suppress(OSError):
+                self.__connection.send(None)
+            self.__connection.close()
+        self.__process.join(10)
+
+
+class ShardedLibrary:
+    PLACEMENTS = ("hash", "branch")
+    MAX_LOCATIONS = 100000            # Book locations remembered in branch placement; the oldest are dropped first
+    LOCK_STRIPES = 64                 # Member lock stripes: one member's borrows and holds are checked one at a time
+
+    def __init__(self, shards, placement="hash"):
+        if placement not in self.PLACEMENTS:
+            raise ValueError(f"Unknown placement '{placement}'.")
+        self.__shards = dict(shards) if isinstance(shards, dict) else dict(enumerate(shards))   # {name: shard}
+        if not self.__shards:
+            raise ValueError("A sharded library needs at least one shard.")
+        self.__names = list(self.__shards)
+        self.__placement = placement
+        self.__locations = {}         # {book_id: shard name}, branch placement only
+        self.__pool = ThreadPoolExecutor(len(self.__shards), thread_name_prefix="shard")
+        self.__member_locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @property
+    def shards(self):
+        return dict(self.__shards)
+
+    def close(self):
+        self.__pool.shutdown()
+        for shard in self.__shards.values():
+            shard.close()
+
+    def shard_of(self, book_id):      # Name of the shard holding book_id (hash placement: the one that would).
+        if self.__placement == "hash":
+            return self.__names[hash(book_id) % len(self.__names)]
+        name = self.__locations.get(book_id)
+        if name is None:              # Not seen by this coordinator: ask every branch
+            found = [name for name, held in zip(self.__names, self.__fan_out("has_book", book_id)) if held]
+            if not found:
+                return None
+            name = self.__remember(book_id, found[0])
+        return name
+
+    def __remember(self, book_id, name):
+        self.__locations[book_id] = name
+        while len(self.__locations) > self.MAX_LOCATIONS:
+            del self.__locations[next(iter(self.__locations))]
+        return name
+
+    def __target(self, book_id, branch=None):   # Shard name for a new book.
+        if self.__placement == "hash":
+            if branch is not None:
+                raise ValueError("Books are placed by ID hash; a branch cannot be chosen.")
+            return self.shard_of(book_id)
+        if branch not in self.__shards:
+            raise ValueError(f"Unknown branch '{branch}'.")
+        return branch
+
+    def __owner(self, book_id):       # Shard holding book_id, or ValueError.
+        name = self.shard_of(book_id)
+        if name is None:
+            raise LibraryError("Book not found", "book_not_found")
+        return self.__shards[name]
+
+    def __fan_out(self, method, *args, **kwargs):   # Calls every shard in parallel; results in shard order.
+        futures = [self.__pool.submit(shard.call, method, *args, **kwargs) for shard in self.__shards.values()]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def __merged(pages, key, offset, limit):   # One page of the rows merged from per-shard pages sorted by key.
+        return list(islice(heapq.merge(*pages, key=key), offset, offset + limit))
+
+    def add_book(self, book, branch=None):
+        if self.__placement == "branch" and self.shard_of(book.book_id) is not None:
+            raise LibraryError(f"A book with ID {book.book_id} already exists", "duplicate")   # In another branch
+        name = self.__target(book.book_id, branch)
+        self.__shards[name].call("add_book", book)
+        if self.__placement == "branch":
+            self.__remember(book.book_id, name)
+
+    def add_books(self, books, branch=None):   # Returns the duplicate IDs skipped (in branch placement, within that branch).
+        batches = {}
+        for book in books:
+            batches.setdefault(self.__target(book.book_id, branch), []).append(book)
+        futures = [self.__pool.submit(self.__shards[name].call, "add_books", batch) for name, batch in batches.items()]
+        return list(chain.from_iterable(future.result() for future in futures))
+
+    def remove_book(self, book_id):
+        self.__owner(book_id).call("remove_book", book_id)
+        self.__locations.pop(book_id, None)
+
+    def add_copies(self, book_id, count, now=None):
+        self.__owner(book_id).call("add_copies", book_id, count, now)
+
+    def add_member(self, member):     # Registered on every shard, each with its own copy holding that shard's loans.
+        futures = [self.__pool.submit(shard.call, "add_member",
+                                      Member(member.name, member.password, member.member_id, hashed=True))
+                   for shard in self.__shards.values()]
+        for future in futures:
+            future.result()
+
+    def remove_member(self, member_id):   # Refused while any shard has them on loan, so no shard drops them alone.
+        with self.__member_locks[hash(member_id) % self.LOCK_STRIPES]:
+            if sum(loans for loans, _ in self.__fan_out("member_usage", member_id)):
+                raise LibraryError("The member has books on loan; they must be returned first.", "on_loan")
+            self.__fan_out("remove_member", member_id)
+
+    def show_found_members(self, name):   # Members are replicated, so any shard answers.
+        return self.__shards[self.__names[0]].call("show_found_members", name)
+
+    def __reserve(self, member_id):   # Refuses a borrow or hold past BORROW_LIMIT over every shard; caller holds the member's lock.
+        if sum(loans + holds for loans, holds in self.__fan_out("member_usage", member_id)) >= Member.BORROW_LIMIT:
+            raise LibraryError("You have reached the borrowing limit!", "limit_reached")
+
+    def borrow_book(self, member_id, book_id, now=None):   # Returns the book's row.
+        owner = self.__owner(book_id)
+        with self.__member_locks[hash(member_id) % self.LOCK_STRIPES]:
+            self.__reserve(member_id)
+            return owner.call("borrow_book", member_id, book_id, now)
+
+    def return_book(self, member_id, book_id, now=None):
+        return self.__owner(book_id).call("return_book", member_id, book_id, now)
+
+    def place_hold(self, member_id, book_id, now=None):
+        owner = self.__owner(book_id)
+        with self.__member_locks[hash(member_id) % self.LOCK_STRIPES]:
+            self.__reserve(member_id)
+            return owner.call("place_hold", member_id, book_id, now)
+
+    def cancel_hold(self, member_id, book_id):
+        return self.__owner(book_id).call("cancel_hold", member_id, book_id)
+
+    def show_member_loans(self, member_id):   # The member's open loans across every shard.
+        return list(chain.from_iterable(self.__fan_out("show_member_loans", member_id)))
+
+    def count_books(self):
+        return sum(self.__fan_out("count_books"))
+
+    def count_copies(self):
+        return sum(self.__fan_out("count_copies"))
+
+    def count_available(self):
+        return sum(self.__fan_out("count_available"))
+
+    def count_open_loans(self):
+        return sum(self.__fan_out("count_open_loans"))
+
+    def count_books_by_author(self, author):
+        return sum(self.__fan_out("count_books_by_author", author))
+
+    def show_books(self):             # {book_id: formatted book} across every shard, by ID.
+        return dict(sorted(chain.from_iterable(listing.items() for listing in self.__fan_out("show_books"))))
+
+    def show_books_page(self, offset=0, limit=20, sort_by="book_id", after_id=None):
+        if sort_by not in ROW_ORDER:
+            raise ValueError(f"Cannot sort books by '{sort_by}'.")
+        if after_id is not None or offset == 0:   # Keyset paging or the first page: each shard's first rows suffice
+            return self.__merged(self.__fan_out("show_books_page", 0, limit, sort_by, after_id),
+                                 ROW_ORDER[sort_by], 0, limit)
+        # A deeper page: merge every shard's first offset + limit sort keys (cheap to send, unlike rows),
+        # then ask the shards for the rows of the page's IDs; each answers for the ones it holds
+        page = list(islice(heapq.merge(*self.__fan_out("page_keys", 0, offset + limit, sort_by)), offset, offset + limit))
+        book_ids = page if sort_by == "book_id" else [book_id for _, book_id in page]
+        rows = {row["ID"]: row for row in chain.from_iterable(self.__fan_out("show_books_by_id", book_ids))}
+        return [rows[book_id] for book_id in book_ids if book_id in rows]   # Skips books removed in between
+
+    def show_available_books(self, offset=0, limit=20):
+        return self.__merged(self.__fan_out("show_available_books", 0, offset + limit), ROW_ORDER["book_id"], offset, limit)
+
+    def show_books_by_author(self, author, offset=0, limit=20):
+        return self.__merged(self.__fan_out("show_books_by_author", author, 0, offset + limit),
+                             ROW_ORDER["book_id"], offset, limit)
+
+    def show_search_results(self, query, limit=20):   # Best hits over every shard; a score does not depend on the shard.
+        hits = chain.from_iterable(self.__fan_out("show_ranked_results", query, limit))
+        return [row for _, row in heapq.nsmallest(limit, hits, key=lambda hit: (-hit[0], hit[1]["ID"]))]
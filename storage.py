@@ -0,0 +1,439 @@
+import glob
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+
+# Storage backends for Library. They only deal with plain records (tuples of
+# IDs and strings), so Library stays the single place that builds Book, Member
+# and Librarian objects. Every backend offers the same methods:
+#   load_books() / load_members() / load_librarians() / load_loans()
+#   save_book() / save_books() / update_copies() / delete_book()
+#   save_member() / delete_member() / save_librarian() / update_password()
+#   save_loan() / close_loan() / load_holds() / save_hold() / delete_hold()
+#   load_setting() / save_setting()
+#   close()
+# Loans are a ledger: rows are (loan_id, member_id, book_id, copy, borrowed_at,
+# due_at, returned_at), timestamps in epoch seconds, returned_at None while open.
+# Deleting a book or a member keeps its loan rows (Library refuses while any is
+# open) and drops its holds.
+# Holds load as (member_id, book_id) in the order they were placed.
+
+
+class MemoryStorage:
+    def __init__(self):
+        self.__books = {}             # {book_id: (book_id, title, author, copies)}
+        self.__members = {}           # {member_id: (member_id, name, password)}
+        self.__librarians = {}        # {employee_id: (employee_id, name, password)}
+        self.__loans = {}             # {loan_id: [loan_id, member_id, book_id, copy, borrowed_at, due_at, returned_at]}
+        self.__holds = {}             # {(member_id, book_id): placed_at}, in placement order
+        self.__settings = {}          # {key: value}, small strings such as the app's "seeded" flag
+
+    def load_books(self):
+        return list(self.__books.values())
+
+    def load_members(self):
+        return list(self.__members.values())
+
+    def load_librarians(self):
+        return list(self.__librarians.values())
+
+    def load_loans(self):
+        return [tuple(self.__loans[loan_id]) for loan_id in sorted(self.__loans)]
+
+    def save_book(self, book_id, title, author, copies=1):
+        self.__books[book_id] = (book_id, title, author, copies)
+
+    def save_books(self, records):    # records: iterable of (book_id, title, author, copies)
+        for record in records:
+            self.__books[record[0]] = tuple(record)
+
+    def update_copies(self, book_id, copies):
+        book_id, title, author, _ = self.__books[book_id]
+        self.__books[book_id] = (book_id, title, author, copies)
+
+    def delete_book(self, book_id):
+        self.__books.pop(book_id, None)   # Its loans stay: the ledger is the circulation history
+        self.__drop_holds(1, book_id)
+
+    def save_member(self, member_id, name, password):
+        self.__members[member_id] = (member_id, name, password)
+
+    def delete_member(self, member_id):
+        self.__members.pop(member_id, None)
+        self.__drop_holds(0, member_id)
+
+    def __drop_holds(self, field, value):   # Deletes the holds whose member (field 0) or book (field 1) is value.
+        for hold in [hold for hold in list(self.__holds) if hold[field] == value]:   # list(): one step under the GIL
+            self.__holds.pop(hold, None)  # In place, so a hold saved meanwhile on another thread is kept
+
+    def save_librarian(self, employee_id, name, password):
+        self.__librarians[employee_id] = (employee_id, name, password)
+
+    def update_password(self, role, user_id, password):    # role is "Member" or "Librarian"
+        users = self.__members if role == "Member" else self.__librarians
+        user_id, name, _ = users[user_id]
+        users[user_id] = (user_id, name, password)
+
+    def save_loan(self, loan_id, member_id, book_id, copy, borrowed_at, due_at):
+        self.__loans[loan_id] = [loan_id, member_id, book_id, copy, borrowed_at, due_at, None]
+
+    def close_loan(self, loan_id, returned_at):
+        self.__loans[loan_id][6] = returned_at
+
+    def load_holds(self):
+        return list(self.__holds)
+
+    def save_hold(self, member_id, book_id, placed_at):
+        self.__holds[(member_id, book_id)] = placed_at
+
+    def delete_hold(self, member_id, book_id):
+        self.__holds.pop((member_id, book_id), None)
+
+    def load_setting(self, key):      # The value saved under key, or None
+        return self.__settings.get(key)
+
+    def save_setting(self, key, value):
+        self.__settings[key] = value
+
+    def dump(self):                   # Copy of the whole state, for snapshots
+        return {"books": dict(self.__books), "members": dict(self.__members), "librarians": dict(self.__librarians),
+                "loans": {loan_id: list(loan) for loan_id, loan in self.__loans.items()}, "holds": dict(self.__holds),
+                "settings": dict(self.__settings)}
+
+    def restore(self, state):         # Replaces the whole state with a dump()
+        self.__books, self.__members, self.__librarians = state["books"], state["members"], state["librarians"]
+        self.__loans, self.__holds = state["loans"], state["holds"]
+        self.__settings = state.get("settings", {})   # Absent from snapshots written before settings existed
+
+    def close(self):
+        pass
+
+
+class JournalStorage(MemoryStorage):
+    # MemoryStorage made durable: every change is appended to an operation journal
+    # before it is applied, and the journal is periodically compacted into a binary
+    # snapshot. Opening the directory maps the latest snapshot and replays only the
+    # journal written since. Files, numbered by generation:
+    #   snapshot.pickle          state as of the start of journal N (pickled dump())
+    #   journal.N.log            records of <length:uint32><pickled (method, args)>
+    # Compaction starts journal N+1, writes the snapshot for it from a copy of the
+    # state on a background thread, then deletes journal N. A crash at any point
+    # leaves a snapshot plus the journals that follow it.
+    COMPACT_EVERY = 100000            # Journal records before a compaction starts on its own
+    MAGIC = b"LIBSNAP1"
+    RECORD = struct.Struct("<I")
+
+    def __init__(self, directory, sync=False, compact_every=COMPACT_EVERY):
+        super().__init__()
+        os.makedirs(directory, exist_ok=True)
+        self.__directory = directory
+        self.__sync = sync            # fsync every record; otherwise a record survives a crash of the process, not of the machine
+        self.__compact_every = compact_every
+        self.__lock = threading.Lock()
+        self.__compacting = None      # Background snapshot thread, while one runs
+        generation = self.__load_snapshot()
+        for path in self.__journals():
+            if self.__generation_of(path) >= generation:
+                self.__replay(path)
+                generation = self.__generation_of(path)
+        self.__generation = generation
+        self.__records = 0            # Records in the current journal
+        self.__journal = open(self.__journal_path(generation), "ab")
+
+    def __journal_path(self, generation):
+        return os.path.join(self.__directory, f"journal.{generation:06d}.log")
+
+    def __journals(self):
+        return sorted(glob.glob(os.path.join(self.__directory, "journal.*.log")), key=self.__generation_of)
+
+    @staticmethod
+    def __generation_of(path):
+        return int(os.path.basename(path).split(".")[1])
+
+    def __load_snapshot(self):        # Restores the snapshot, if any; returns the journal generation it leads into.
+        path = os.path.join(self.__directory, "snapshot.pickle")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return 0
+        with open(path, "rb") as stream, mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            if view[:len(self.MAGIC)] != self.MAGIC:
+                raise ValueError(f"{path} is not a library snapshot.")
+            generation = self.RECORD.unpack_from(view, len(self.MAGIC))[0]
+            with memoryview(view) as buffer, buffer[len(self.MAGIC) + self.RECORD.size:] as state:
+                self.restore(pickle.loads(state))     # Unpickled straight from the mapping, no copy of the file
+        return generation
+
+    def __replay(self, path):         # Applies a journal's records; a torn record at the end (crash mid-write) is cut off.
+        with open(path, "rb") as stream:
+            data = stream.read()
+        position = 0
+        while position + self.RECORD.size <= len(data):
+            length = self.RECORD.unpack_from(data, position)[0]
+            end = position + self.RECORD.size + length
+            if end > len(data):
+                break
+            method, args = pickle.loads(data[position + self.RECORD.size:end])
+            getattr(MemoryStorage, method)(self, *args)
+            position = end
+        if position < len(data):
+            with open(path, "r+b") as stream:
+                stream.truncate(position)
+
+    def __log(self, method, *args):   # Journals one change, then applies it to the in-memory state.
+        payload = pickle.dumps((method, args), pickle.HIGHEST_PROTOCOL)
+        with self.__lock:
+            self.__journal.write(self.RECORD.pack(len(payload)) + payload)
+            self.__journal.flush()
+            if self.__sync:
+                os.fsync(self.__journal.fileno())
+            getattr(MemoryStorage, method)(self, *args)
+            self.__records += 1
+            if self.__records >= self.__compact_every and self.__compacting is None:
+                self.__start_compaction()
+
+    def compact(self, wait=True):     # Snapshots the current state and drops the journals it covers.
+        with self.__lock:
+            if self.__compacting is None:
+                self.__start_compaction()
+            thread = self.__compacting
+        if wait:
+            thread.join()
+
+    def __start_compaction(self):     # Caller holds the lock: switches to a new journal and snapshots a copy in the background.
+        state, generation = self.dump(), self.__generation + 1
+        self.__journal.close()
+        self.__generation, self.__records = generation, 0
+        self.__journal = open(self.__journal_path(generation), "ab")
+        self.__compacting = threading.Thread(target=self.__write_snapshot, args=(state, generation),
+                                             name="snapshot", daemon=True)
+        self.__compacting.start()
+
+    def __write_snapshot(self, state, generation):
+        path = os.path.join(self.__directory, "snapshot.pickle")
+        with open(f"{path}.tmp", "wb") as stream:
+            stream.write(self.MAGIC + self.RECORD.pack(generation))
+            pickle.dump(state, stream, pickle.HIGHEST_PROTOCOL)
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(f"{path}.tmp", path)
+        for journal in self.__journals():
+            if self.__generation_of(journal) < generation:
+                os.remove(journal)
+        with self.__lock:
+            self.__compacting = None
+
+    def save_book(self, book_id, title, author, copies=1):
+        self.__log("save_book", book_id, title, author, copies)
+
+    def save_books(self, records):
+        self.__log("save_books", [tuple(record) for record in records])
+
+    def update_copies(self, book_id, copies):
+        self.__log("update_copies", book_id, copies)
+
+    def delete_book(self, book_id):
+        self.__log("delete_book", book_id)
+
+    def save_member(self, member_id, name, password):
+        self.__log("save_member", member_id, name, password)
+
+    def delete_member(self, member_id):
+        self.__log("delete_member", member_id)
+
+    def save_librarian(self, employee_id, name, password):
+        self.__log("save_librarian", employee_id, name, password)
+
+    def update_password(self, role, user_id, password):
+        self.__log("update_password", role, user_id, password)
+
+    def save_loan(self, loan_id, member_id, book_id, copy, borrowed_at, due_at):
+        self.__log("save_loan", loan_id, member_id, book_id, copy, borrowed_at, due_at)
+
+    def close_loan(self, loan_id, returned_at):
+        self.__log("close_loan", loan_id, returned_at)
+
+    def save_hold(self, member_id, book_id, placed_at):
+        self.__log("save_hold", member_id, book_id, placed_at)
+
+    def delete_hold(self, member_id, book_id):
+        self.__log("delete_hold", member_id, book_id)
+
+    def save_setting(self, key, value):
+        self.__log("save_setting", key, value)
+
+    def close(self):
+        with self.__lock:
+            thread = self.__compacting
+        if thread is not None:
+            thread.join()
+        with self.__lock:
+            self.__journal.close()
+
+
+class SQLiteStorage:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS books (
+            book_id INTEGER PRIMARY KEY,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            copies INTEGER NOT NULL DEFAULT 1
+        );
+        CREATE TABLE IF NOT EXISTS members (
+            member_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS librarians (
+            employee_id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            password TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS loan_ledger (
+            loan_id INTEGER PRIMARY KEY,
+            member_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            copy INTEGER NOT NULL DEFAULT 1,
+            borrowed_at REAL NOT NULL,
+            due_at REAL NOT NULL,
+            returned_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS loan_ledger_member_id ON loan_ledger (member_id);
+        CREATE INDEX IF NOT EXISTS loan_ledger_book_id ON loan_ledger (book_id);
+        CREATE INDEX IF NOT EXISTS loan_ledger_open_due ON loan_ledger (due_at) WHERE returned_at IS NULL;
+        CREATE TABLE IF NOT EXISTS holds (
+            hold_id INTEGER PRIMARY KEY,
+            member_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            placed_at REAL NOT NULL,
+            UNIQUE (member_id, book_id)
+        );
+        CREATE INDEX IF NOT EXISTS holds_book_id ON holds (book_id);
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+    ADDED_COLUMNS = (                 # Columns added after the first release, for databases created before them
+        ("books", "copies", "INTEGER NOT NULL DEFAULT 1"),
+    )
+    LEGACY_LOAN_DAYS = 14             # Due date given to loans migrated from the old, undated loans table
+
+    def __init__(self, path):
+        # One connection shared by every Streamlit script thread, serialised by a lock.
+        self.__conn = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = threading.Lock()
+        self.__conn.execute("PRAGMA journal_mode=WAL")      # Readers never block the writer
+        self.__conn.execute("PRAGMA synchronous=NORMAL")    # Durable at each WAL checkpoint, no fsync per commit
+        with self.__conn:
+            self.__conn.executescript(self.SCHEMA)
+            for table, column, definition in self.ADDED_COLUMNS:
+                existing = {row[1] for row in self.__conn.execute(f"PRAGMA table_info({table})")}
+                if column not in existing:
+                    self.__conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            self.__migrate_loans()
+
+    def __migrate_loans(self):        # Moves open loans from the old loans table into the ledger.
+        if not self.__conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'loans'").fetchone():
+            return
+        columns = {row[1] for row in self.__conn.execute("PRAGMA table_info(loans)")}
+        copy = "copy" if "copy" in columns else "1"
+        now = time.time()
+        self.__conn.execute(
+            f"INSERT INTO loan_ledger (member_id, book_id, copy, borrowed_at, due_at) "
+            f"SELECT member_id, book_id, {copy}, ?, ? FROM loans",
+            (now, now + self.LEGACY_LOAN_DAYS * 86400))
+        self.__conn.execute("DROP TABLE loans")
+
+    def __query(self, sql, params=()):
+        with self.__lock:
+            return self.__conn.execute(sql, params).fetchall()
+
+    def __write(self, *statements):    # Runs (sql, params) pairs in one transaction.
+        with self.__lock, self.__conn:
+            for sql, params in statements:
+                self.__conn.execute(sql, params)
+
+    def load_books(self):
+        return self.__query("SELECT book_id, title, author, copies FROM books ORDER BY book_id")
+
+    def load_members(self):
+        return self.__query("SELECT member_id, name, password FROM members")
+
+    def load_librarians(self):
+        return self.__query("SELECT employee_id, name, password FROM librarians")
+
+    def load_loans(self):
+        return self.__query("SELECT loan_id, member_id, book_id, copy, borrowed_at, due_at, returned_at "
+                            "FROM loan_ledger ORDER BY loan_id")
+
+    def save_book(self, book_id, title, author, copies=1):
+        self.__write(("INSERT OR REPLACE INTO books (book_id, title, author, copies) VALUES (?, ?, ?, ?)",
+                      (book_id, title, author, copies)))
+
+    def save_books(self, records):    # records: iterable of (book_id, title, author, copies), written in one transaction
+        with self.__lock, self.__conn:
+            self.__conn.executemany("INSERT OR REPLACE INTO books (book_id, title, author, copies) VALUES (?, ?, ?, ?)",
+                                    records)
+
+    def update_copies(self, book_id, copies):
+        self.__write(("UPDATE books SET copies = ? WHERE book_id = ?", (copies, book_id)))
+
+    def delete_book(self, book_id):
+        self.__write(("DELETE FROM holds WHERE book_id = ?", (book_id,)),   # Its loans stay: the ledger is the circulation history
+                     ("DELETE FROM books WHERE book_id = ?", (book_id,)))
+
+    def save_member(self, member_id, name, password):
+        self.__write(("INSERT OR REPLACE INTO members (member_id, name, password) VALUES (?, ?, ?)",
+                      (member_id, name, password)))
+
+    def delete_member(self, member_id):
+        self.__write(("DELETE FROM holds WHERE member_id = ?", (member_id,)),
+                     ("DELETE FROM members WHERE member_id = ?", (member_id,)))
+
+    def save_librarian(self, employee_id, name, password):
+        self.__write(("INSERT OR REPLACE INTO librarians (employee_id, name, password) VALUES (?, ?, ?)",
+                      (employee_id, name, password)))
+
+    def update_password(self, role, user_id, password):    # role is "Member" or "Librarian"
+        if role == "Member":
+            sql = "UPDATE members SET password = ? WHERE member_id = ?"
+        else:
+            sql = "UPDATE librarians SET password = ? WHERE employee_id = ?"
+        self.__write((sql, (password, user_id)))
+
+    def save_loan(self, loan_id, member_id, book_id, copy, borrowed_at, due_at):
+        self.__write(("INSERT INTO loan_ledger (loan_id, member_id, book_id, copy, borrowed_at, due_at) "
+                      "VALUES (?, ?, ?, ?, ?, ?)", (loan_id, member_id, book_id, copy, borrowed_at, due_at)))
+
+    def close_loan(self, loan_id, returned_at):
+        self.__write(("UPDATE loan_ledger SET returned_at = ? WHERE loan_id = ?", (returned_at, loan_id)))
+
+    def load_holds(self):
+        return self.__query("SELECT member_id, book_id FROM holds ORDER BY hold_id")
+
+    def save_hold(self, member_id, book_id, placed_at):
+        self.__write(("INSERT INTO holds (member_id, book_id, placed_at) VALUES (?, ?, ?)",
+                      (member_id, book_id, placed_at)))
+
+    def delete_hold(self, member_id, book_id):
+        self.__write(("DELETE FROM holds WHERE member_id = ? AND book_id = ?", (member_id, book_id)))
+
+    def load_setting(self, key):      # The value saved under key, or None
+        rows = self.__query("SELECT value FROM settings WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def save_setting(self, key, value):
+        self.__write(("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value)))
+
+    def close(self):
+        with self.__lock:
+            self.__conn.close()
+
+
+def open_storage(path):               # A directory (or a path ending in .journal) opens a JournalStorage, anything else SQLite.
+    if os.path.isdir(path) or path.rstrip("/").endswith(".journal"):
+        return JournalStorage(path)
+    return SQLiteStorage(path)